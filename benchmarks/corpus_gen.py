@@ -0,0 +1,71 @@
+import numpy as np
+
+from src.corpus_store import Corpus
+from src.synthetic_wsd import SYNTHETIC_PAIRS, STOPWORDS
+from src.synthetic_train import SEED_RULES
+
+
+SCALES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+VOCAB_SIZE = 50_000
+SENTS_PER_DOC = (1, 5)
+SENT_LEN = (5, 20)
+ZIPF_EXPONENT = 1.3
+TARGET_RATE = 1 / 200      # share of tokens replaced by a pseudoword source word
+CUE_RATE = 0.5             # share of those that get a seed cue of their sense nearby
+
+
+def generate_corpus(n_docs, seed=0):
+    """
+    Deterministic synthetic corpus for benchmarks, as an array-backed Corpus.
+
+    Filler tokens are Zipf-distributed over VOCAB_SIZE words (the stopwords
+    are the most frequent ones). The source words of SYNTHETIC_PAIRS are
+    planted at TARGET_RATE, half of them with one of their sense's
+    SEED_RULES cues within three tokens, so seed labeling and bootstrapping
+    have work to do. The same (n_docs, seed) always gives the same corpus.
+    """
+    rng = np.random.default_rng(seed)
+
+    sources = [w for pair in SYNTHETIC_PAIRS.values() for w in pair]
+    cues = sorted({c for rules in SEED_RULES.values() for words in rules.values() for c in words})
+    fixed = sorted(STOPWORDS) + sorted(set(sources) | set(cues))
+    vocab = fixed + [f"w{i}" for i in range(VOCAB_SIZE - len(fixed))]
+    word_ids = {w: i for i, w in enumerate(vocab)}
+    n_stop = len(STOPWORDS)
+    filler = np.concatenate([np.arange(n_stop), np.arange(len(fixed), VOCAB_SIZE)])
+
+    sents_per_doc = rng.integers(SENTS_PER_DOC[0], SENTS_PER_DOC[1] + 1, n_docs)
+    sent_lens = rng.integers(SENT_LEN[0], SENT_LEN[1] + 1, int(sents_per_doc.sum()))
+    n_tokens = int(sent_lens.sum())
+
+    ranks = (rng.zipf(ZIPF_EXPONENT, n_tokens) - 1) % len(filler)
+    tokens = filler[ranks].astype(np.int32)
+    del ranks
+
+    positions = np.unique(rng.integers(0, n_tokens, int(n_tokens * TARGET_RATE)))
+    pair_idx = rng.integers(0, len(SYNTHETIC_PAIRS), len(positions))
+    sense = rng.integers(1, 3, len(positions))
+    pseudowords = list(SYNTHETIC_PAIRS)
+    source_ids = np.array([[word_ids[w] for w in SYNTHETIC_PAIRS[p]] for p in pseudowords])
+    tokens[positions] = source_ids[pair_idx, sense - 1]
+
+    with_cue = rng.random(len(positions)) < CUE_RATE
+    offsets = rng.choice([-3, -2, -1, 1, 2, 3], len(positions))
+    cue_pos = np.clip(positions + offsets, 0, n_tokens - 1)
+    cue_table = [
+        [[word_ids[c] for c in SEED_RULES[p][s]] for s in (1, 2)]
+        for p in pseudowords
+    ]
+    for pos, p, s in zip(cue_pos[with_cue].tolist(), pair_idx[with_cue].tolist(), sense[with_cue].tolist()):
+        choices = cue_table[p][s - 1]
+        tokens[pos] = choices[pos % len(choices)]
+    # A cue must not overwrite a planted source word.
+    tokens[positions] = source_ids[pair_idx, sense - 1]
+
+    sent_offsets = np.zeros(len(sent_lens) + 1, dtype=np.int64)
+    np.cumsum(sent_lens, out=sent_offsets[1:])
+    doc_offsets = np.zeros(n_docs + 1, dtype=np.int64)
+    np.cumsum(sents_per_doc, out=doc_offsets[1:])
+
+    return Corpus(vocab, tokens, sent_offsets, doc_offsets)
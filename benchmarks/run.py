@@ -0,0 +1,182 @@
+import io
+import sys
+import json
+import time
+import platform
+import argparse
+import resource
+import subprocess
+from pathlib import Path
+from contextlib import redirect_stdout
+
+import numpy as np
+
+from benchmarks.corpus_gen import SCALES, generate_corpus
+
+
+BENCH_DIR = Path(__file__).parent
+BASELINE_FILE = BENCH_DIR / "baseline.json"
+RESULTS_FILE = BENCH_DIR / "latest.json"
+TOLERANCE = 0.20    # slower than baseline by more than this is a regression...
+MIN_DELTA_S = 0.01  # ...and by at least this much, so timer noise on tiny stages is ignored
+REPEAT = 3          # each stage is timed this many times and the fastest run is kept
+
+
+def peak_rss_mb():
+    # Peak RSS of the process so far: ru_maxrss never decreases, so a stage
+    # reports the largest peak of itself and every stage before it.
+    # ru_maxrss is in KiB on Linux and bytes on macOS.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1 << 20) if sys.platform == "darwin" else rss / 1024
+
+
+def measure(records, stage, fn, repeat=REPEAT):
+    """Run fn() -> (result, n_items) and record its best wall time, throughput and the cumulative peak RSS."""
+    wall = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            result, n_items = fn()
+        elapsed = time.perf_counter() - start
+        wall = elapsed if wall is None else min(wall, elapsed)
+    records.append({
+        "stage": stage,
+        "wall_s": wall,
+        "items": n_items,
+        "items_per_s": n_items / wall if wall > 0 else None,
+        "cum_peak_rss_mb": peak_rss_mb(),
+    })
+    return result
+
+
+def run_scale(n_docs, seed=0, repeat=REPEAT):
+    """All benchmarked stages on one generated corpus, in pipeline order."""
+    from src.preprocess import build_token_index
+    from src.synthetic_wsd import SYNTHETIC_PAIRS, extract_synthetic_features, find_occurrences
+    from src.synthetic_ospd import apply_ospd
+    from src.core.features import FeatureVocab
+    from src.core.decision_list import apply_decision_list
+    from src import synthetic_train
+
+    records = []
+    corpus = measure(records, "generate_corpus", lambda: (
+        (c := generate_corpus(n_docs, seed)), len(c.tokens)), repeat=1)
+
+    token_index = measure(records, "build_token_index", lambda: (
+        build_token_index(corpus), len(corpus.tokens)), repeat)
+
+    occurrences = find_occurrences(token_index, SYNTHETIC_PAIRS)
+    n_instances = sum(len(occs) for occs in occurrences.values())
+
+    positions = {
+        word: tuple(np.array([o[i] for o in occs], dtype=np.int64) for i in range(3))
+        for word, occs in occurrences.items()
+    }
+
+    def extract_all():
+        return extract_synthetic_features(corpus, positions, FeatureVocab()), n_instances
+
+    feature_sets = measure(records, "extract_features", extract_all, repeat)
+    words = list(feature_sets)
+    nnz = sum(len(m.indices) for m in feature_sets.values())
+
+    seeds = measure(records, "apply_seed_rules", lambda: (
+        {w: synthetic_train.apply_seed_rules(w, feature_sets) for w in words}, n_instances), repeat)
+
+    stats = measure(records, "compute_feature_stats", lambda: (
+        {w: synthetic_train.compute_feature_stats(w, feature_sets, seeds[w]) for w in words}, nnz), repeat)
+
+    n_features = sum(len(ids) for ids, _ in stats.values())
+    rules = measure(records, "compute_llr", lambda: (
+        {w: synthetic_train.compute_llr(stats[w]) for w in words}, n_features), repeat)
+
+    predictions = measure(records, "apply_decision_list", lambda: (
+        {w: apply_decision_list(w, feature_sets, seeds[w], rules[w]) for w in words}, n_instances), repeat)
+
+    measure(records, "apply_ospd", lambda: (
+        {w: apply_ospd(w, predictions[w], feature_sets) for w in words}, n_instances), repeat)
+
+    measure(records, "bootstrap", lambda: (
+        {w: synthetic_train.train_single_word(w, feature_sets) for w in words}, n_instances), repeat)
+
+    return records
+
+
+def run_all(scales, seed=0, repeat=REPEAT):
+    """Each scale runs in a fresh interpreter so its peak RSS is its own."""
+    results = {}
+    for scale in scales:
+        print(f"Running scale {scale} ({SCALES[scale]} documents)...", file=sys.stderr)
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.run", "--child", scale, "--seed", str(seed),
+             "--repeat", str(repeat)],
+            check=True, capture_output=True, text=True,
+        )
+        results[scale] = json.loads(out.stdout)
+    return {
+        "meta": {
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "seed": seed,
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, tolerance=TOLERANCE):
+    """Print current vs baseline wall time per stage; return the regressed (scale, stage) pairs."""
+    regressions = []
+    print(f"{'scale':6s} {'stage':22s} {'wall_s':>10s} {'baseline':>10s} {'ratio':>7s} {'cum_rss_mb':>10s}")
+    for scale, records in current["results"].items():
+        base = {r["stage"]: r for r in baseline["results"].get(scale, [])}
+        for r in records:
+            b = base.get(r["stage"])
+            if b is None or not b["wall_s"]:
+                print(f"{scale:6s} {r['stage']:22s} {r['wall_s']:10.4f} {'-':>10s} {'-':>7s} {r['cum_peak_rss_mb']:10.1f}")
+                continue
+            ratio = r["wall_s"] / b["wall_s"]
+            slower = r["wall_s"] - b["wall_s"] > MIN_DELTA_S
+            flag = "  REGRESSION" if ratio > 1 + tolerance and slower else ""
+            if flag:
+                regressions.append((scale, r["stage"]))
+            print(f"{scale:6s} {r['stage']:22s} {r['wall_s']:10.4f} {b['wall_s']:10.4f} {ratio:7.2f} "
+                  f"{r['cum_peak_rss_mb']:10.1f}{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on generated corpora.")
+    parser.add_argument("--scales", nargs="+", choices=list(SCALES), default=list(SCALES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=Path, default=RESULTS_FILE)
+    parser.add_argument("--baseline", type=Path, default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="timed runs per stage (fastest is kept)")
+    parser.add_argument("--child", choices=list(SCALES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        json.dump(run_scale(SCALES[args.child], args.seed, args.repeat), sys.stdout)
+        sys.exit()
+
+    current = run_all(args.scales, args.seed, args.repeat)
+    with open(args.out, "w") as f:
+        json.dump(current, f, indent=2)
+    print(f"Saved {args.out}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"Saved baseline {args.baseline}")
+    elif args.baseline.exists():
+        with open(args.baseline) as f:
+            regressions = compare(current, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} stage(s) slower than baseline by more than {args.tolerance:.0%}")
+            sys.exit(1)
+    else:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one.")
@@ -1,9 +1,18 @@
 
 import pickle
+import argparse
+from functools import partial
 from pathlib import Path
-import math
-from collections import defaultdict
-from src.preprocess import load_preprocessed_data
+
+import numpy as np
+
+from src.core.features import FEATURE_VOCAB_FILE, FeatureVocab, feature_counts, load_feature_sets, row_min
+from src.core.incremental import bootstrap
+from src.core.parallel import train_parallel
+from src.core.llr import rank_decision_list
+from src.core.model_store import MODEL_FILE, LABELS_FILE, save_model
+from src.core.seed_matcher import SeedMatcher
+from src.core.telemetry import telemetry, instrumented, add_arguments as add_telemetry_arguments
 
 DATA_DIR = Path("data/preprocessed")
 
@@ -34,57 +43,39 @@ SEED_RULES = {
     
 }
 
+# "exact": a keyword matches a feature value exactly (WINDOW=act, not WINDOW=fact)
+# "substring": a keyword matches any feature containing it
+SEED_MATCH = "exact"
 
-def apply_seed_rules(word, feature_sets):
-    labels = {}  # instance_id -> sense
-
-    seed_rules = SEED_RULES.get(word, {})
-
-    for inst_id, inst in enumerate(feature_sets[word]):
-        feats = inst["features"]
-        for sense, keywords in seed_rules.items():
-            for kw in keywords:
-                if any(kw in f for f in feats):
-                    labels[inst_id] = sense
-                    break
-            if inst_id in labels:
-                break
-
-    return labels
-
-def compute_feature_stats(word, feature_sets, labels):
-    stats = defaultdict(lambda: defaultdict(int))
-
-    for inst_id, inst in enumerate(feature_sets[word]):
-        if inst_id not in labels:
-            continue
-        sense = labels[inst_id]
-
-        for f in inst["features"]:
-            stats[f][sense] += 1
+LLR_SMOOTHING = 0.1
+MAX_ITERATIONS = 10
 
-    return stats
+# OSPD agreement threshold used inside the bootstrapping loop, or None to
+# bootstrap from the decision list alone.
+BOOTSTRAP_OSPD = None
 
+# Train on each distinct context once, weighted by how many instances share
+# it. Same model and labels; not used with BOOTSTRAP_OSPD, which can label
+# copies in different documents differently.
+DEDUP_CONTEXTS = False
 
-def compute_llr(stats):
-    decision_list = []
 
-    for f, counts in stats.items():
-        c1 = counts.get(1, 0)
-        c2 = counts.get(2, 0)
+def apply_seed_rules(word, feature_sets, mode=SEED_MATCH):
+    matcher = SeedMatcher(SEED_RULES.get(word, {}), mode=mode)
 
-        # Add smoothing
-        p1 = (c1 + 0.1) / (c1 + c2 + 0.2)
-        p2 = (c2 + 0.1) / (c1 + c2 + 0.2)
+    return matcher.label(feature_sets[word])  # instance_id -> sense
 
-        llr = math.log(p1 / p2)
-        pred_sense = 1 if llr > 0 else 2
-        decision_list.append((f, pred_sense, abs(llr)))
+def compute_feature_stats(word, feature_sets, labels):
+    # Sparse matrix x label product: (feature_ids, counts[:, sense - 1])
+    return feature_counts(feature_sets[word], labels)
 
-    # Sort by absolute LLR
-    decision_list.sort(key=lambda x: x[2], reverse=True)
 
-    return decision_list
+def compute_llr(stats, top_k=None):
+    # Sorted by absolute LLR
+    feature_ids, counts = stats
+    return rank_decision_list(
+        feature_ids, counts, smoothing=LLR_SMOOTHING, normalized=True, top_k=top_k
+    )
 
 
 # def apply_decision_list(word, feature_sets, labels, decision_list):
@@ -102,69 +93,188 @@ def compute_llr(stats):
 
 #     return changes
 
+class CompiledDecisionList:
+    """
+    Inverted index over a sorted decision list: feature -> (rank, sense).
+    An instance is labeled by the best-ranked rule among its own features,
+    which is the same rule a first-match scan of the sorted list would hit.
+    predict_all does this for a whole FeatureMatrix with array lookups.
+    """
+
+    def __init__(self, decision_list_rules):
+        self.rules = {}
+        for rank, (feature, sense, score) in enumerate(decision_list_rules):
+            if feature not in self.rules:
+                self.rules[feature] = (rank, sense)
+        self.scores = [score for _, _, score in decision_list_rules]
+        self.n_rules = len(decision_list_rules)
+        self.max_feature = max(self.rules, default=-1)
+        self.rank_by_feature = None
+
+    def __len__(self):
+        return len(self.rules)
+
+    def predict(self, feats):
+        best = None
+        for f in feats:
+            hit = self.rules.get(f)
+            if hit is not None and (best is None or hit[0] < best[0]):
+                best = hit
+        return best[1] if best is not None else None
+
+    def _rank_by_feature(self, n_features):
+        if self.rank_by_feature is None or len(self.rank_by_feature) < n_features:
+            self.rank_by_feature = np.full(n_features, np.iinfo(np.int64).max, dtype=np.int64)
+            self.sense_by_rank = np.zeros(self.n_rules, dtype=np.int8)
+            self.score_by_rank = np.array(self.scores, dtype=np.float64)
+            for feature, (rank, sense) in self.rules.items():
+                self.rank_by_feature[feature] = rank
+                self.sense_by_rank[rank] = sense
+        return self.rank_by_feature
+
+    def _best_ranks(self, matrix):
+        n_features = max(self.max_feature, int(matrix.indices.max(initial=-1))) + 1
+        rank_by_feature = self._rank_by_feature(n_features)
+
+        missing = np.iinfo(np.int64).max
+        best_rank = row_min(matrix, rank_by_feature, missing)
+        return best_rank, best_rank != missing
+
+    def predict_scores(self, matrix):
+        """
+        (senses, scores) arrays for a FeatureMatrix: the sense and LLR of the
+        rule that labels each instance, 0 / nan where no rule applies.
+        """
+        best_rank, hit = self._best_ranks(matrix)
+        senses = np.zeros(len(matrix), dtype=np.int8)
+        scores = np.full(len(matrix), np.nan)
+        senses[hit] = self.sense_by_rank[best_rank[hit]]
+        scores[hit] = self.score_by_rank[best_rank[hit]]
+        return senses, scores
+
+    def predict_all(self, matrix):
+        best_rank, hit = self._best_ranks(matrix)
+
+        predictions = [None] * len(matrix)
+        senses = self.sense_by_rank[best_rank[hit]].tolist()
+        for inst_id, sense in zip(np.flatnonzero(hit).tolist(), senses):
+            predictions[inst_id] = sense
+        return predictions
+
+
 def apply_decision_list(word, feature_sets, labels, decision_list_rules):
     """
     Apply decision list to ALL instances for a given word.
     Return a list where predictions[i] is the predicted sense for instance i.
     """
 
-    predictions = []
-    instances = feature_sets[word]  # list of dictionaries
+    compiled = CompiledDecisionList(decision_list_rules)
 
-    for inst in instances:
-        feats = inst["features"]
-        predicted = None
+    return compiled.predict_all(feature_sets[word])
 
-        # check rule list in descending LLR (already sorted)
-        for feature, sense, score in decision_list_rules:
-            if feature in feats:
-                predicted = sense
-                break
-
-        predictions.append(predicted)
-
-    return predictions
 
+def prune_decision_list(decision_list_rules, matrix=None, labels=None,
+                        min_count=None, min_llr=None, top_k=None, drop_redundant=False):
+    """
+    Smaller decision list with the same rule order:
 
-def bootstrap(word, feature_sets):
-    labels = apply_seed_rules(word, feature_sets)
+    min_count       drop rules whose feature occurs on fewer than min_count
+                    labeled instances of matrix (labels: inst_id -> sense)
+    min_llr         drop rules scoring below min_llr
+    top_k           keep the top_k best-ranked rules
+    drop_redundant  drop rules that label no instance of matrix because a
+                    higher-ranked rule always fires first; predictions on
+                    matrix are unchanged
 
-    for iteration in range(10):
-        print(f"Bootstrapping iteration {iteration}")
+    The filters are applied in that order.
+    """
+    rules = decision_list_rules
+    if min_count:
+        feature_ids, counts = feature_counts(matrix, labels)
+        totals = dict(zip(feature_ids.tolist(), counts.sum(axis=1).tolist()))
+        rules = [r for r in rules if totals.get(r[0], 0) >= min_count]
+    if min_llr is not None:
+        rules = [r for r in rules if r[2] >= min_llr]
+    if top_k is not None:
+        rules = rules[:top_k]
+    if drop_redundant:
+        best_rank, hit = CompiledDecisionList(rules)._best_ranks(matrix)
+        fires = np.zeros(len(rules), dtype=bool)
+        fires[best_rank[hit]] = True
+        rules = [r for r, f in zip(rules, fires.tolist()) if f]
+    return rules
+
+
+def prune_model(model, feature_sets, **options):
+    """prune_decision_list for every word of a {word: {"labels", "decision_list"}} model, against its training labels."""
+    return {
+        word: {**m, "decision_list": prune_decision_list(m["decision_list"], feature_sets[word], m["labels"], **options)}
+        for word, m in model.items()
+    }
 
-        feature_stats = compute_feature_stats(word, feature_sets, labels)
-        decision_list = compute_llr(feature_stats)
 
-        new_labels = apply_decision_list(word, feature_sets, labels, decision_list)
+def add_pruning_arguments(parser):
+    parser.add_argument("--min-count", type=int, help="prune rules seen on fewer labeled instances")
+    parser.add_argument("--min-llr", type=float, help="prune rules scoring below this LLR")
+    parser.add_argument("--top-k", type=int, help="keep only the k best-ranked rules per word")
+    parser.add_argument("--drop-redundant", action="store_true",
+                        help="prune rules that never fire before a higher-ranked rule")
 
-        print(f"  new labels = {new_labels}")
-        if new_labels == 0:
-            break
 
-    return labels, decision_list
+def pruning_options(args):
+    """The prune_decision_list options set on the command line ({} if none)."""
+    options = {
+        "min_count": args.min_count,
+        "min_llr": args.min_llr,
+        "top_k": args.top_k,
+        "drop_redundant": args.drop_redundant,
+    }
+    return {k: v for k, v in options.items() if v not in (None, False)}
+
+
+def train_single_word(word, feature_sets, ospd_threshold=BOOTSTRAP_OSPD, dedup=DEDUP_CONTEXTS):
+    print(f"\n=== Training decision list for '{word}' ===")
+    labels, dlist = bootstrap(
+        word, feature_sets[word], SEED_RULES.get(word, {}), SEED_MATCH, smoothing=LLR_SMOOTHING,
+        normalized=True, ospd_threshold=ospd_threshold, dedup=dedup, max_iterations=MAX_ITERATIONS,
+    )
+    return {
+        "labels": labels,
+        "decision_list": dlist
+    }
 
 
 if __name__ == "__main__":
-    # Load data
-    corpus, token_index = load_preprocessed_data(DATA_DIR)
-
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=1,
+                        help="> 1 trains target words in parallel on a process pool")
+    parser.add_argument("--ospd", type=float, default=BOOTSTRAP_OSPD, metavar="THRESHOLD",
+                        help="apply one-sense-per-discourse inside the bootstrapping loop")
+    parser.add_argument("--dedup", action="store_true", default=DEDUP_CONTEXTS,
+                        help="train on distinct contexts weighted by their count (ignored with --ospd)")
+    add_pruning_arguments(parser)
+    add_telemetry_arguments(parser)
+    args = parser.parse_args()
+    prune = pruning_options(args)
 
-    with open(DATA_DIR / "feature_sets.pkl", "rb") as f:
-        feature_sets = pickle.load(f)
     with open(DATA_DIR / "targets.pkl", "rb") as f:
         targets = pickle.load(f)
+    train_fn = partial(train_single_word, ospd_threshold=args.ospd, dedup=args.dedup)
 
-    model_output = {}
+    with instrumented(args.metrics, args.profile):
+        if args.workers > 1:
+            model_output = train_parallel(train_fn, DATA_DIR, targets, workers=args.workers)
+        else:
+            with telemetry.timer("load"):
+                feature_sets, feature_vocab = load_feature_sets(DATA_DIR)
+            model_output = {}
+            for word in targets:
+                model_output[word] = train_fn(word, feature_sets)
 
-    for word in targets:
-        print(f"\n=== Training decision list for '{word}' ===")
-        labels, dlist = bootstrap(word, feature_sets)
-        model_output[word] = {
-            "labels": labels,
-            "decision_list": dlist
-        }
+        if prune:
+            with telemetry.timer("prune"):
+                model_output = prune_model(model_output, load_feature_sets(DATA_DIR)[0], **prune)
 
-    with open(DATA_DIR / "decision_lists.pkl", "wb") as f:
-        pickle.dump(model_output, f)
+        save_model(model_output, FeatureVocab.load(DATA_DIR / FEATURE_VOCAB_FILE), DATA_DIR)
 
-    print("\nSaved decision_lists.pkl")
\ No newline at end of file
+        print(f"\nSaved {MODEL_FILE} and {LABELS_FILE}")
@@ -0,0 +1,149 @@
+import numpy as np
+
+from src.corpus_store import CorpusOverlay, corpus_segments, encode_corpus
+from src.core.features import FeatureMatrix
+
+WINDOW_LABEL = "WINDOW"
+
+
+def _overlay_tokens(substitutions, word_ids, n_words):
+    """
+    Substitutions of a CorpusOverlay as (doc_ids, sent_ids, tok_ids, token
+    ids) arrays. Words outside the corpus vocabulary (the pseudowords) get
+    new ids n_words, n_words + 1, ...; returns those words too.
+    """
+    new_words = {}
+    rows = []
+    for (doc_id, sent_id), subs in substitutions.items():
+        for tok_id, word in subs.items():
+            token = word_ids.get(word)
+            if token is None:
+                token = new_words.setdefault(word, n_words + len(new_words))
+            rows.append((doc_id, sent_id, tok_id, token))
+    arrays = np.array(rows, dtype=np.int64).reshape(-1, 4).T
+    return arrays, list(new_words)
+
+
+def _gather(corpus, doc_ids, sent_ids, tok_ids, offsets, substituted):
+    """
+    Token ids at tok_id + offsets of every instance, (n, len(offsets)), and
+    a mask of the ones inside the instance's sentence. Substituted positions
+    read their overlay token ids.
+    """
+    n = len(doc_ids)
+    tokens = np.zeros((n, len(offsets)), dtype=np.int64)
+    inside = np.zeros((n, len(offsets)), dtype=bool)
+    sub_doc, sub_sent, sub_tok, sub_token = substituted
+
+    for segment, base in corpus_segments(corpus):
+        sent_offsets = np.asarray(segment.sent_offsets)
+        doc_offsets = np.asarray(segment.doc_offsets)
+        rows = np.flatnonzero((doc_ids >= base) & (doc_ids < base + len(segment)))
+        if not len(rows):
+            continue
+
+        sents = doc_offsets[doc_ids[rows] - base] + sent_ids[rows]
+        start = sent_offsets[sents]
+        end = sent_offsets[sents + 1]
+        at = (start + tok_ids[rows])[:, None] + offsets
+        ok = (at >= start[:, None]) & (at < end[:, None])
+        at = np.where(ok, at, start[:, None])
+        ids = np.asarray(segment.tokens)[at].astype(np.int64)
+
+        subs = (sub_doc >= base) & (sub_doc < base + len(segment))
+        if subs.any():
+            sub_at = sent_offsets[doc_offsets[sub_doc[subs] - base] + sub_sent[subs]] + sub_tok[subs]
+            order = np.argsort(sub_at)
+            sub_at = sub_at[order]
+            k = np.minimum(np.searchsorted(sub_at, at), len(sub_at) - 1)
+            hit = sub_at[k] == at
+            ids[hit] = sub_token[subs][order][k[hit]]
+
+        tokens[rows] = ids
+        inside[rows] = ok
+    return tokens, inside
+
+
+def extract_feature_matrices(corpus, positions, vocab, collocations, window,
+                             stopwords=(), skip_target=False, distances=False):
+    """
+    LEFT/RIGHT/WINDOW features of every instance of every target word,
+    gathered as arrays over the corpus's flat token ids.
+
+    positions     : {word: (doc_ids, sent_ids, tok_ids)}
+    collocations  : ((label, offset), ...) single-token features, in order
+    window        : WINDOW=w features for every other token within this
+                    distance of the target, in sentence order
+    stopwords     : words never used as features
+    skip_target   : also drop WINDOW tokens equal to the target word
+
+    corpus may be a CorpusOverlay; its substituted words are read in place
+    of the base tokens. Feature strings are interned in vocab in the order
+    a per-instance loop would meet them, so the matrices are the same as
+    with FeatureMatrixBuilder. Returns {word: FeatureMatrix}, and with
+    distances also {word: int16 distance of every entry} (0 for the
+    collocations, the WINDOW token's distance from the target otherwise).
+    """
+    substitutions = {}
+    if isinstance(corpus, CorpusOverlay):
+        substitutions = corpus.substitutions
+        corpus = corpus.base
+    if not hasattr(corpus, "vocab"):
+        corpus = encode_corpus(corpus)
+
+    words = list(positions)
+    doc_ids, sent_ids, tok_ids = (
+        np.concatenate([np.asarray(positions[w][i], dtype=np.int64) for w in words] or [np.zeros(0, np.int64)])
+        for i in range(3)
+    )
+    word_ids = {w: i for i, w in enumerate(corpus.vocab)}
+    substituted, new_words = _overlay_tokens(substitutions, word_ids, len(corpus.vocab))
+    token_words = list(corpus.vocab) + new_words
+
+    # One column per collocation, then one per WINDOW offset (target excluded)
+    reach = max([window] + [abs(offset) for _, offset in collocations])
+    span = np.arange(-reach, reach + 1)
+    window_offsets = [d for d in range(-window, window + 1) if d != 0]
+    columns = np.array([offset for _, offset in collocations] + window_offsets) + reach
+    labels = [label for label, _ in collocations] + [WINDOW_LABEL]
+    column_label = np.array(list(range(len(collocations))) + [len(collocations)] * len(window_offsets))
+    column_distance = np.array([0] * len(collocations) + [abs(d) for d in window_offsets], dtype=np.int16)
+
+    tokens, inside = _gather(corpus, doc_ids, sent_ids, tok_ids, span, substituted)
+    is_stopword = np.zeros(len(token_words), dtype=bool)
+    is_stopword[[word_ids[w] for w in stopwords if w in word_ids]] = True
+
+    ids = tokens[:, columns]
+    keep = inside[:, columns] & ~is_stopword[ids]
+    if skip_target:
+        target = tokens[:, reach]
+        keep[:, len(collocations):] &= ids[:, len(collocations):] != target[:, None]
+
+    # Intern (label, token) pairs by first occurrence in row-major order.
+    codes = (column_label * len(token_words) + ids)[keep]
+    unique, first, inverse = np.unique(codes, return_index=True, return_inverse=True)
+    feature_ids = np.empty(len(unique), dtype=np.int32)
+    for u in np.argsort(first, kind="stable").tolist():
+        label, token = divmod(int(unique[u]), len(token_words))
+        feature_ids[u] = vocab.add(f"{labels[label]}={token_words[token]}")
+    indices = feature_ids[inverse.reshape(-1)]
+    entry_distance = np.broadcast_to(column_distance, keep.shape)[keep]
+
+    indptr = np.zeros(len(keep) + 1, dtype=np.int64)
+    np.cumsum(keep.sum(axis=1), out=indptr[1:])
+    matrices = {}
+    entry_distances = {}
+    lo = 0
+    for word in words:
+        hi = lo + len(positions[word][0])
+        a, b = indptr[lo], indptr[hi]
+        matrices[word] = FeatureMatrix(
+            indptr[lo:hi + 1] - a, indices[a:b],
+            *(np.asarray(positions[word][i], dtype=np.int32) for i in range(3)),
+            vocab=vocab,
+        )
+        entry_distances[word] = entry_distance[a:b]
+        lo = hi
+    if distances:
+        return matrices, entry_distances
+    return matrices
@@ -0,0 +1,227 @@
+from pathlib import Path
+
+import numpy as np
+
+
+FEATURE_VOCAB_FILE = "feature_vocab.txt"
+FEATURE_SETS_DIR = "feature_sets"
+MATRIX_ARRAYS = ("indptr", "indices", "doc_ids", "sent_ids", "tok_ids")
+
+
+class FeatureVocab:
+    """Interns feature strings ("WINDOW=oil") to integer ids."""
+
+    def __init__(self, strings=()):
+        self.strings = list(strings)
+        self.ids = {f: i for i, f in enumerate(self.strings)}
+
+    def __len__(self):
+        return len(self.strings)
+
+    def __getitem__(self, feature_id):
+        return self.strings[feature_id]
+
+    def __contains__(self, feature):
+        return feature in self.ids
+
+    def add(self, feature):
+        feature_id = self.ids.get(feature)
+        if feature_id is None:
+            feature_id = self.ids[feature] = len(self.strings)
+            self.strings.append(feature)
+        return feature_id
+
+    def get(self, feature, default=None):
+        return self.ids.get(feature, default)
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for feature in self.strings:
+                f.write(feature + "\n")
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls(f.read().splitlines())
+
+
+class FeatureMatrix:
+    """
+    CSR instance x feature matrix of one target word. The feature ids of
+    instance i are indices[indptr[i]:indptr[i + 1]], in extraction order;
+    doc_ids / sent_ids / tok_ids give the position of each instance.
+    """
+
+    def __init__(self, indptr, indices, doc_ids, sent_ids, tok_ids, vocab=None):
+        self.indptr = indptr
+        self.indices = indices
+        self.doc_ids = doc_ids
+        self.sent_ids = sent_ids
+        self.tok_ids = tok_ids
+        self.vocab = vocab
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def row(self, inst_id):
+        return self.indices[self.indptr[inst_id]:self.indptr[inst_id + 1]]
+
+    def rows(self):
+        """Feature ids of every instance as Python lists, for per-instance loops."""
+        flat = self.indices.tolist()
+        bounds = self.indptr.tolist()
+        return [flat[bounds[i]:bounds[i + 1]] for i in range(len(self))]
+
+    def row_ids(self):
+        """Instance id of every stored feature (the CSR row of each nnz)."""
+        return np.repeat(np.arange(len(self)), np.diff(self.indptr))
+
+    def features(self, inst_id):
+        return [self.vocab[f] for f in self.row(inst_id).tolist()]
+
+
+class FeatureMatrixBuilder:
+    def __init__(self, vocab):
+        self.vocab = vocab
+        self.indptr = [0]
+        self.indices = []
+        self.doc_ids = []
+        self.sent_ids = []
+        self.tok_ids = []
+
+    def add(self, doc_id, sent_id, tok_id, feats):
+        add = self.vocab.add
+        self.indices.extend(add(f) for f in feats)
+        self.indptr.append(len(self.indices))
+        self.doc_ids.append(doc_id)
+        self.sent_ids.append(sent_id)
+        self.tok_ids.append(tok_id)
+
+    def build(self):
+        return FeatureMatrix(
+            np.array(self.indptr, dtype=np.int64),
+            np.array(self.indices, dtype=np.int32),
+            np.array(self.doc_ids, dtype=np.int32),
+            np.array(self.sent_ids, dtype=np.int32),
+            np.array(self.tok_ids, dtype=np.int32),
+            vocab=self.vocab,
+        )
+
+
+def concat_feature_matrices(first, second):
+    """Rows of first followed by the rows of second (same feature vocabulary)."""
+    return FeatureMatrix(
+        np.concatenate([first.indptr, second.indptr[1:] + first.indptr[-1]]),
+        *(np.concatenate([getattr(first, name), getattr(second, name)]) for name in MATRIX_ARRAYS[1:]),
+        vocab=first.vocab,
+    )
+
+
+def take_rows(matrix, rows):
+    """The instances `rows` (in that order) of a FeatureMatrix, as a new FeatureMatrix."""
+    rows = np.asarray(rows, dtype=np.int64)
+    starts = matrix.indptr[rows]
+    lengths = matrix.indptr[rows + 1] - starts
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+    positions = np.repeat(starts - indptr[:-1], lengths) + np.arange(indptr[-1])
+    return FeatureMatrix(
+        indptr, matrix.indices[positions],
+        *(getattr(matrix, name)[rows] for name in MATRIX_ARRAYS[2:]),
+        vocab=matrix.vocab,
+    )
+
+
+def unique_rows(matrix):
+    """
+    Collapse instances with identical feature lists (same ids in the same
+    order) into one context each. Returns (unique, inverse, weights):
+    unique holds the first instance of every distinct list, in instance
+    order, inverse[i] is the row of instance i in unique and weights[u] the
+    number of instances sharing row u.
+    """
+    data = np.ascontiguousarray(matrix.indices).tobytes()
+    size = matrix.indices.itemsize
+    bounds = (matrix.indptr * size).tolist()
+
+    row_of = {}
+    first = []
+    inverse = np.empty(len(matrix), dtype=np.int64)
+    for inst_id, (start, end) in enumerate(zip(bounds, bounds[1:])):
+        u = row_of.setdefault(data[start:end], len(first))
+        if u == len(first):
+            first.append(inst_id)
+        inverse[inst_id] = u
+    weights = np.bincount(inverse, minlength=len(first))
+    return take_rows(matrix, first), inverse, weights
+
+
+def row_min(matrix, values, missing):
+    """
+    Per-instance minimum of values[feature_id] over each row of the matrix;
+    rows without features get `missing`.
+    """
+    out = np.full(len(matrix), missing, dtype=values.dtype)
+    lengths = np.diff(matrix.indptr)
+    nonempty = np.flatnonzero(lengths)
+    if len(nonempty):
+        gathered = values[matrix.indices]
+        out[nonempty] = np.minimum.reduceat(gathered, matrix.indptr[nonempty])
+    return out
+
+
+def label_array(n, labels):
+    """Dense int8 label vector (0 = unlabeled) from an inst_id -> sense dict."""
+    row_labels = np.zeros(n, dtype=np.int8)
+    if labels:
+        row_labels[np.fromiter(labels.keys(), dtype=np.int64, count=len(labels))] = \
+            np.fromiter(labels.values(), dtype=np.int8, count=len(labels))
+    return row_labels
+
+
+def feature_counts(matrix, labels, senses=(1, 2)):
+    """
+    Sparse matrix x label product: per-sense counts of every feature seen on
+    a labeled instance.
+
+    Returns (feature_ids, counts) with counts[:, k] the count for senses[k].
+    Features are in the order they are first seen when walking labeled
+    instances in instance order, the insertion order of the old dict stats.
+    """
+    nnz_labels = np.repeat(label_array(len(matrix), labels), np.diff(matrix.indptr))
+    labeled = np.flatnonzero(nnz_labels)
+    feats = matrix.indices[labeled]
+
+    feature_ids, first = np.unique(feats, return_index=True)
+    feature_ids = feature_ids[np.argsort(first)]
+
+    n_features = int(feats.max()) + 1 if len(feats) else 0
+    counts = np.empty((len(feature_ids), len(senses)), dtype=np.int64)
+    for k, sense in enumerate(senses):
+        per_feature = np.bincount(feats[nnz_labels[labeled] == sense], minlength=n_features)
+        counts[:, k] = per_feature[feature_ids]
+    return feature_ids, counts
+
+
+def save_feature_sets(feature_sets, vocab, out_dir):
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    vocab.save(out / FEATURE_VOCAB_FILE)
+
+    for word, matrix in feature_sets.items():
+        word_dir = out / FEATURE_SETS_DIR / word
+        word_dir.mkdir(parents=True, exist_ok=True)
+        for name in MATRIX_ARRAYS:
+            np.save(word_dir / f"{name}.npy", getattr(matrix, name))
+
+
+def load_feature_sets(out_dir, mmap_mode="r"):
+    """Return ({word: FeatureMatrix}, FeatureVocab) saved by save_feature_sets."""
+    out = Path(out_dir)
+    vocab = FeatureVocab.load(out / FEATURE_VOCAB_FILE)
+
+    feature_sets = {}
+    for word_dir in sorted((out / FEATURE_SETS_DIR).iterdir()):
+        arrays = [np.load(word_dir / f"{name}.npy", mmap_mode=mmap_mode) for name in MATRIX_ARRAYS]
+        feature_sets[word_dir.name] = FeatureMatrix(*arrays, vocab=vocab)
+    return feature_sets, vocab
@@ -0,0 +1,221 @@
+from bisect import bisect_left, insort
+from collections import defaultdict
+from functools import partial
+
+import numpy as np
+
+from src.core.features import unique_rows
+from src.core.llr import llr_scores
+from src.core.seed_matcher import SeedMatcher
+from src.core.telemetry import telemetry
+from src.synthetic_ospd import DocumentGroups, DocumentTallies
+
+
+class IncrementalDecisionList:
+    """
+    Decision list that is updated as labels are added instead of being
+    recomputed from every labeled instance on each bootstrapping iteration.
+
+    Only the newly labeled instances are counted, only the features whose
+    counts changed are rescored, and the ranking is a sorted list that is
+    patched in place for a few changed keys and re-merged otherwise. Rules
+    are ordered by descending LLR, ties by the position at which the
+    feature was first seen among labeled instances, which is the order
+    compute_feature_stats + compute_llr produce.
+
+    score_fn(counts) -> (senses, llr) scores an (n, 2) array of sense counts
+    in one vectorized call (see src/core/llr.py). It is the scoring of the
+    trainer's own compute_llr, so both paths give identical decision lists.
+
+    With weights, each row stands for weights[row] identical instances (see
+    unique_rows in src/core/features.py) and is counted that many times;
+    instance_labels() maps the labels back to the instances.
+    """
+
+    def __init__(self, feature_rows, score_fn, weights=None):
+        self.rows = feature_rows
+        self.score_fn = score_fn
+        self.weights = None if weights is None else np.asarray(weights).tolist()
+        self.labels = {}
+        self.batches = []
+
+        self.counts = defaultdict(lambda: defaultdict(int))
+        self.first_seen = {}
+        self.keys = {}      # feature -> its entry in self.ranking
+        self.senses = {}    # feature -> predicted sense
+        self.ranking = []   # sorted (-llr, inst_id, pos, feature)
+
+        self.instances_with = defaultdict(list)
+        for inst_id, feats in enumerate(feature_rows):
+            for f in set(feats):
+                self.instances_with[f].append(inst_id)
+        self.new_features = set()
+
+    def __len__(self):
+        return len(self.ranking)
+
+    def add_labels(self, new_labels):
+        with telemetry.timer("stats"):
+            changed = self._count(new_labels)
+        if changed:
+            with telemetry.timer("llr"):
+                self._rescore(list(changed))
+
+    def _count(self, new_labels):
+        changed = {}
+        if self.weights is not None:
+            self.batches.append(list(new_labels))
+        for inst_id, sense in new_labels.items():
+            self.labels[inst_id] = sense
+            weight = 1 if self.weights is None else self.weights[inst_id]
+            for pos, f in enumerate(self.rows[inst_id]):
+                self.counts[f][sense] += weight
+                seen = self.first_seen.get(f)
+                if seen is None or (inst_id, pos) < seen:
+                    self.first_seen[f] = (inst_id, pos)
+                changed[f] = None
+        telemetry.count("labels_added", len(new_labels))
+        return changed
+
+    def _rescore(self, changed):
+        telemetry.count("features_rescored", len(changed))
+        counts = np.array(
+            [(self.counts[f].get(1, 0), self.counts[f].get(2, 0)) for f in changed],
+            dtype=np.int64,
+        )
+        senses, llrs = self.score_fn(counts)
+
+        old_keys = []
+        new_keys = []
+        for f, sense, llr in zip(changed, senses.tolist(), llrs.tolist()):
+            old = self.keys.get(f)
+            if old is None:
+                self.new_features.add(f)
+            else:
+                old_keys.append(old)
+            inst_id, pos = self.first_seen[f]
+            key = (-llr, inst_id, pos, f)
+            new_keys.append(key)
+            self.keys[f] = key
+            self.senses[f] = sense
+
+        ranking = self.ranking
+        # Each del / insort moves O(n) list entries, so patching in place
+        # only pays for a handful of keys; anything more is merged.
+        if len(changed) <= len(ranking).bit_length():
+            for key in old_keys:
+                del ranking[bisect_left(ranking, key)]
+            for key in new_keys:
+                insort(ranking, key)
+        else:
+            # Large batch: drop stale entries and merge the sorted batch in;
+            # sorting two sorted runs is a linear merge.
+            stale = set(old_keys)
+            new_keys.sort()
+            self.ranking = sorted([k for k in ranking if k not in stale] + new_keys)
+
+    def predict(self, feats):
+        best = None
+        for f in feats:
+            key = self.keys.get(f)
+            if key is not None and (best is None or key < best):
+                best = key
+        return self.senses[best[3]] if best is not None else None
+
+    def propose_labels(self):
+        """
+        Label every unlabeled instance the current list covers. An instance
+        left unlabeled by the previous call had no feature in the list, so
+        only instances containing a feature added since then can change.
+        """
+        with telemetry.timer("apply_rules"):
+            return self._propose_labels()
+
+    def _propose_labels(self):
+        candidates = set()
+        for f in self.new_features:
+            candidates.update(self.instances_with[f])
+        self.new_features = set()
+
+        new_labels = {}
+        for inst_id in sorted(candidates):
+            if inst_id in self.labels:
+                continue
+            sense = self.predict(self.rows[inst_id])
+            if sense is not None:
+                new_labels[inst_id] = sense
+        return new_labels
+
+    def instance_labels(self, inverse):
+        """
+        inst_id -> sense for the instances behind weighted rows (inverse[i]
+        is the row of instance i), in the order training on the instances
+        themselves would have labeled them: by batch, then by instance.
+        """
+        labels = {}
+        for batch in self.batches:
+            in_batch = np.zeros(len(self.weights), dtype=bool)
+            in_batch[batch] = True
+            inst_ids = np.flatnonzero(in_batch[inverse])
+            labels.update((i, self.labels[u]) for i, u in zip(inst_ids.tolist(), inverse[inst_ids].tolist()))
+        return labels
+
+    def decision_list(self):
+        return [(f, self.senses[f], -neg_llr) for neg_llr, _, _, f in self.ranking]
+
+
+def bootstrap(word, matrix, seed_rules, seed_match="exact", smoothing=0.1, normalized=False,
+              ospd_threshold=None, dedup=False, max_iterations=10):
+    """
+    Grow the labeled set of one word's FeatureMatrix from its seed rules
+    ({sense: [cue, ...]}, matched with SeedMatcher in seed_match mode) with
+    an IncrementalDecisionList scored by llr_scores(smoothing, normalized).
+    With ospd_threshold, each batch of labels is extended to the other
+    instances of documents whose per-document sense tally reaches the
+    threshold (DocumentTallies in src/synthetic_ospd.py). With dedup,
+    instances with identical feature lists are trained on as one weighted
+    context (unique_rows in src/core/features.py); not used with OSPD.
+
+    Returns (labels, decision_list): inst_id -> sense and the list learned
+    before the last batch of labels, as in the original per-iteration loop.
+    """
+    telemetry.mark()
+    inverse = weights = None
+    if dedup and ospd_threshold is None:
+        with telemetry.timer("dedup"):
+            matrix, inverse, weights = unique_rows(matrix)
+        telemetry.count("duplicate_instances", len(inverse) - len(matrix))
+
+    score_fn = partial(llr_scores, smoothing=smoothing, normalized=normalized)
+    trainer = IncrementalDecisionList(matrix.rows(), score_fn, weights=weights)
+    with telemetry.timer("seed_labeling"):
+        seeds = SeedMatcher(seed_rules, mode=seed_match).label(matrix)
+
+    tallies = None
+    if ospd_threshold is not None:
+        with telemetry.timer("ospd"):
+            tallies = DocumentTallies(DocumentGroups(matrix.doc_ids), ospd_threshold)
+            seeds = tallies.extend(seeds, trainer.labels)
+    trainer.add_labels(seeds)
+    telemetry.iteration(word, "seed", len(seeds), len(trainer.labels), len(trainer))
+
+    decision_list = None
+    for iteration in range(max_iterations):
+        new_labels = trainer.propose_labels()
+        extra = {}
+        if tallies is not None:
+            n_proposed = len(new_labels)
+            with telemetry.timer("ospd"):
+                new_labels = tallies.extend(new_labels, trainer.labels)
+            extra["ospd_added"] = len(new_labels) - n_proposed
+        if iteration == max_iterations - 1 or not new_labels:
+            decision_list = trainer.decision_list()
+        trainer.add_labels(new_labels)
+        telemetry.iteration(word, iteration, len(new_labels), len(trainer.labels), len(trainer), **extra)
+        if not new_labels:
+            break
+    if decision_list is None:
+        decision_list = trainer.decision_list()
+
+    labels = trainer.labels if inverse is None else trainer.instance_labels(inverse)
+    return labels, decision_list
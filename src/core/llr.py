@@ -0,0 +1,69 @@
+import math
+
+import numpy as np
+
+
+def llr_scores(counts, smoothing=0.1, normalized=False):
+    """
+    Smoothed |log-likelihood ratio| and predicted sense for every row of an
+    (n, 2) array of sense-1 / sense-2 counts.
+
+    normalized=False uses (c1 + a) / (c2 + a), as src/synthetic_train.py does;
+    normalized=True uses the ratio of smoothed sense probabilities
+    (c1 + a) / (n + 2a) over (c2 + a) / (n + 2a), as src/core/decision_list.py
+    does. The log is taken with math.log once per distinct ratio (counts are
+    small integers, so there are few), which keeps the scores bit-identical
+    to the scalar code and therefore the rule order unchanged.
+
+    Returns (senses, llr) arrays.
+    """
+    counts = np.asarray(counts)
+    c1 = counts[:, 0].astype(np.float64)
+    c2 = counts[:, 1].astype(np.float64)
+
+    if normalized:
+        total = c1 + c2 + 2 * smoothing
+        ratio = ((c1 + smoothing) / total) / ((c2 + smoothing) / total)
+    else:
+        ratio = (c1 + smoothing) / (c2 + smoothing)
+
+    distinct, inverse = np.unique(ratio, return_inverse=True)
+    logs = np.array([math.log(r) for r in distinct.tolist()], dtype=np.float64)
+    llr = np.abs(logs)[inverse.reshape(-1)]
+
+    senses = np.where(c1 > c2, 1, 2).astype(np.int8)
+    return senses, llr
+
+
+def rank_order(llr, top_k=None):
+    """
+    Indices of llr in descending order; equal scores keep their input order,
+    as list.sort(key=..., reverse=True) does. With top_k, only the first
+    top_k of that order are selected (argpartition) and sorted.
+    """
+    llr = np.asarray(llr)
+    if top_k is None or top_k >= len(llr):
+        return np.argsort(-llr, kind="stable")
+    if top_k <= 0:
+        return np.zeros(0, dtype=np.int64)
+
+    kth = -np.partition(-llr, top_k - 1)[top_k - 1]
+    above = np.flatnonzero(llr > kth)
+    ties = np.flatnonzero(llr == kth)[:top_k - len(above)]
+    selected = np.concatenate([above, ties])
+    return selected[np.lexsort((selected, -llr[selected]))]
+
+
+def rank_decision_list(feature_ids, counts, smoothing=0.1, normalized=False, top_k=None):
+    """
+    Vectorized compute_llr: score the features of a feature_counts result
+    and return the decision list [(feature_id, sense, llr), ...] sorted by
+    descending llr.
+    """
+    senses, llr = llr_scores(counts, smoothing=smoothing, normalized=normalized)
+    order = rank_order(llr, top_k=top_k)
+    return list(zip(
+        np.asarray(feature_ids)[order].tolist(),
+        senses[order].tolist(),
+        llr[order].tolist(),
+    ))
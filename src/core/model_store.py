@@ -0,0 +1,199 @@
+import mmap
+import pickle
+import struct
+from pathlib import Path
+
+import numpy as np
+
+from src.core.features import FEATURE_VOCAB_FILE, FeatureVocab
+
+
+MODEL_FILE = "decision_lists.bin"
+LABELS_FILE = "decision_labels.pkl"
+LEGACY_MODEL_FILE = "decision_lists.pkl"
+
+MAGIC = b"WSDDLIST"
+VERSION = 1
+
+# magic, version, n_words, n_features, n_rules, then the byte offsets of the
+# word table, rule directory, feature table and rule array
+HEADER = struct.Struct("<8sIIQQQQQQ")
+RULE_DTYPE = np.dtype([("feature_id", "<i4"), ("sense", "i1"), ("score", "<f4")])
+ALIGN = 8
+
+# File layout, every section starting on an 8-byte boundary:
+#
+#   header
+#   word table      int64 offsets[n_words + 1], then the UTF-8 word names
+#   rule directory  int64 starts[n_words + 1]: word i's rules are rules[starts[i]:starts[i + 1]]
+#   feature table   int64 offsets[n_features + 1], then the UTF-8 feature strings
+#                   (feature_vocab.txt; rule feature ids index it)
+#   rules           RULE_DTYPE records of every word, each word's in rank order
+
+
+def _string_table(strings):
+    data = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(data) + 1, dtype=np.int64)
+    np.cumsum([len(d) for d in data], out=offsets[1:])
+    return offsets.tobytes() + b"".join(data)
+
+
+def save_model(model, feature_vocab, out_dir):
+    """
+    Write a {word: {"labels", "decision_list"}} training result as MODEL_FILE
+    (the rules) and LABELS_FILE (the training labels, which predicting does
+    not need) in out_dir.
+    """
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    words = list(model)
+
+    starts = np.zeros(len(words) + 1, dtype=np.int64)
+    np.cumsum([len(model[w]["decision_list"]) for w in words], out=starts[1:])
+    rules = np.zeros(int(starts[-1]), dtype=RULE_DTYPE)
+    for word, start in zip(words, starts.tolist()):
+        dl = model[word]["decision_list"]
+        if dl:
+            feature_ids, senses, scores = zip(*dl)
+            rules["feature_id"][start:start + len(dl)] = feature_ids
+            rules["sense"][start:start + len(dl)] = senses
+            rules["score"][start:start + len(dl)] = scores
+
+    sections = [_string_table(words), starts.tobytes(), _string_table(feature_vocab.strings), rules.tobytes()]
+    offsets = []
+    pos = HEADER.size
+    for section in sections:
+        pos += -pos % ALIGN
+        offsets.append(pos)
+        pos += len(section)
+
+    tmp = out / (MODEL_FILE + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(words), len(feature_vocab), len(rules), *offsets))
+        for offset, section in zip(offsets, sections):
+            f.write(b"\0" * (offset - f.tell()))
+            f.write(section)
+    tmp.replace(out / MODEL_FILE)
+
+    with open(out / LABELS_FILE, "wb") as f:
+        pickle.dump({word: model[word]["labels"] for word in words}, f)
+
+
+class ModelFile:
+    """
+    Read-only view of a MODEL_FILE. The file is memory-mapped and only the
+    header and word table are read on open; a word's rules are a zero-copy
+    slice of the mapped rule array and are read when first used, so opening
+    and looking up a word cost the same however many words the model has.
+    Training labels are read from LABELS_FILE only if labels() is called.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, n_words, n_features, n_rules, *offsets = HEADER.unpack_from(self.buf)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a decision list model file")
+        if version != VERSION:
+            raise ValueError(f"{self.path} has model format version {version}, expected {VERSION}")
+        words_at, directory_at, features_at, rules_at = offsets
+
+        self.n_features = n_features
+        self.features_at = features_at
+        self.words = self._strings(words_at, n_words)
+        self.word_ids = {w: i for i, w in enumerate(self.words)}
+        self.starts = np.frombuffer(self.buf, dtype=np.int64, count=n_words + 1, offset=directory_at)
+        self.feature_offsets = np.frombuffer(self.buf, dtype=np.int64, count=n_features + 1, offset=features_at)
+        self.feature_data_at = features_at + 8 * (n_features + 1)
+        self.rules_array = np.frombuffer(self.buf, dtype=RULE_DTYPE, count=n_rules, offset=rules_at)
+        self._labels = None
+
+    def _strings(self, offset, n):
+        offsets = np.frombuffer(self.buf, dtype=np.int64, count=n + 1, offset=offset).tolist()
+        data_at = offset + 8 * (n + 1)
+        return [self.buf[data_at + a:data_at + b].decode("utf-8") for a, b in zip(offsets, offsets[1:])]
+
+    def __len__(self):
+        return len(self.words)
+
+    def __iter__(self):
+        return iter(self.words)
+
+    def __contains__(self, word):
+        return word in self.word_ids
+
+    def rules(self, word):
+        """RULE_DTYPE array (feature_id, sense, score) of one word, in rank order."""
+        i = self.word_ids[word]
+        return self.rules_array[self.starts[i]:self.starts[i + 1]]
+
+    def decision_list(self, word):
+        """The word's rules as the [(feature_id, sense, score), ...] list the trainers produce."""
+        return self.rules(word).tolist()
+
+    def feature(self, feature_id):
+        a, b = self.feature_offsets[feature_id:feature_id + 2].tolist()
+        return self.buf[self.feature_data_at + a:self.feature_data_at + b].decode("utf-8")
+
+    def feature_vocab(self):
+        """The feature strings the rules' feature ids index, as a FeatureVocab."""
+        return FeatureVocab(self._strings(self.features_at, self.n_features))
+
+    def labels(self, word):
+        if self._labels is None:
+            with open(self.path.parent / LABELS_FILE, "rb") as f:
+                self._labels = pickle.load(f)
+        return self._labels[word]
+
+
+class PickledModel:
+    """The ModelFile interface over a legacy decision_lists.pkl."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.model = pickle.load(f)
+        self.words = list(self.model)
+
+    def __len__(self):
+        return len(self.words)
+
+    def __iter__(self):
+        return iter(self.words)
+
+    def __contains__(self, word):
+        return word in self.model
+
+    def decision_list(self, word):
+        return self.model[word]["decision_list"]
+
+    def feature_vocab(self):
+        # Legacy pickles do not record their features.
+        return None
+
+    def labels(self, word):
+        return self.model[word]["labels"]
+
+
+def load_model(data_dir, feature_vocab=None):
+    """
+    Open the model saved by save_model in data_dir, or a legacy
+    decision_lists.pkl. With feature_vocab (the vocabulary of the feature
+    matrices the rules will be applied to), raise ValueError unless the
+    model's feature table is a prefix of it: features re-extracted after
+    training would otherwise silently pair every rule with another feature.
+    """
+    data_dir = Path(data_dir)
+    if (data_dir / MODEL_FILE).exists():
+        model = ModelFile(data_dir / MODEL_FILE)
+    else:
+        model = PickledModel(data_dir / LEGACY_MODEL_FILE)
+
+    if feature_vocab is not None:
+        trained = model.feature_vocab()
+        if trained is not None and trained.strings != feature_vocab.strings[:len(trained)]:
+            raise ValueError(
+                f"The model in {data_dir} was trained on different features than the current "
+                f"{FEATURE_VOCAB_FILE}; retrain it after re-extracting features")
+    return model
@@ -0,0 +1,61 @@
+import os
+import sys
+from multiprocessing import Pool
+
+from src.core.features import load_feature_sets
+from src.core.telemetry import telemetry
+
+
+# Per-worker feature matrices. They are memory-mapped from the .npy files
+# written by save_feature_sets, so every worker shares the same page cache
+# and nothing but the word list is pickled per task.
+_feature_sets = None
+
+
+def init_worker(data_dir, quiet=False, setup=None, *setup_args):
+    """
+    Pool initializer for workers that train on the feature matrices in
+    data_dir. quiet turns off telemetry echo and discards stdout, for pools
+    whose workers run many bootstraps per task. setup(feature_sets,
+    *setup_args) then sets any per-worker state of the calling module.
+    """
+    global _feature_sets
+    # Forked workers start with a copy of the parent's measurements.
+    telemetry.reset()
+    if quiet:
+        telemetry.echo = False
+        sys.stdout = open(os.devnull, "w")
+    with telemetry.timer("load"):
+        _feature_sets, _ = load_feature_sets(data_dir)
+    if setup is not None:
+        setup(_feature_sets, *setup_args)
+
+
+def _train_chunk(task):
+    # Each worker's telemetry goes back with its results, so the parent's
+    # --metrics export covers the whole run.
+    train_fn, words = task
+    results = [(word, train_fn(word, _feature_sets)) for word in words]
+    return results, telemetry.drain()
+
+
+def train_parallel(train_fn, data_dir, words, workers=None, chunk_size=1):
+    """
+    Run train_fn(word, feature_sets) -> {"labels", "decision_list"} for every
+    word on a process pool and return {word: result} in the order of words,
+    the layout of decision_lists.pkl.
+
+    train_fn must be a module-level function so it can be sent to workers.
+    Larger words are scheduled first to keep the pool busy at the end.
+    """
+    feature_sets, _ = load_feature_sets(data_dir)
+    by_size = sorted(words, key=lambda w: len(feature_sets[w]), reverse=True)
+    chunks = [by_size[i:i + chunk_size] for i in range(0, len(by_size), chunk_size)]
+
+    results = {}
+    with Pool(workers, initializer=init_worker, initargs=(data_dir,)) as pool:
+        for chunk_results, worker_telemetry in pool.imap_unordered(_train_chunk, [(train_fn, c) for c in chunks]):
+            results.update(chunk_results)
+            telemetry.merge(worker_telemetry)
+
+    return {word: results[word] for word in words}
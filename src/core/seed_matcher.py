@@ -0,0 +1,61 @@
+import re
+
+import numpy as np
+
+from src.core.features import row_min
+
+
+class SeedMatcher:
+    """
+    Seed cues of one word compiled once, so seed labeling is a single pass
+    over each instance's features.
+
+    mode="exact"      a cue matches a feature whose value equals it
+                      ("WINDOW=oil" matches "oil", not "soil"); one dict
+                      lookup per feature.
+    mode="substring"  the old `cue in feature` semantics; the cues of each
+                      sense are compiled into one regex alternation.
+
+    label(matrix) gives every instance of a FeatureMatrix the first sense
+    (in SEED_RULES order) with a cue matching one of its features.
+    """
+
+    def __init__(self, seed_rules, mode="exact"):
+        self.mode = mode
+        self.senses = list(seed_rules)
+
+        if mode == "exact":
+            self.cue_priority = {}
+            for priority, cues in enumerate(seed_rules.values()):
+                for cue in cues:
+                    self.cue_priority.setdefault(cue, priority)
+        elif mode == "substring":
+            self.patterns = [
+                re.compile("|".join(re.escape(cue) for cue in cues)) if cues else None
+                for cues in seed_rules.values()
+            ]
+        else:
+            raise ValueError(f"Unknown seed match mode: {mode!r}")
+
+    def priority(self, feature):
+        """Index of the first sense with a cue matching this feature, or len(senses)."""
+        if self.mode == "exact":
+            return self.cue_priority.get(feature.partition("=")[2], len(self.senses))
+        for priority, pattern in enumerate(self.patterns):
+            if pattern is not None and pattern.search(feature):
+                return priority
+        return len(self.senses)
+
+    def label(self, matrix):
+        """
+        Seed labels {inst_id: sense} for a FeatureMatrix. Cues are resolved
+        once per distinct feature id; each instance then takes the smallest
+        priority among its features.
+        """
+        none = len(self.senses)
+        vocab = matrix.vocab
+        present = np.unique(matrix.indices)
+        priorities = np.full(len(vocab), none, dtype=np.int32)
+        priorities[present] = [self.priority(vocab[f]) for f in present.tolist()]
+        best = row_min(matrix, priorities, none)
+        return {inst_id: self.senses[p] for inst_id, p in enumerate(best.tolist()) if p != none}
@@ -0,0 +1,142 @@
+import json
+import time
+import cProfile
+import resource
+from pathlib import Path
+from contextlib import contextmanager, nullcontext
+from collections import defaultdict
+
+
+def rss_mb():
+    """Current resident set size in MB (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize() / (1 << 20)
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Telemetry:
+    """
+    Timers, counters and per-iteration training events for one process.
+
+    timer(name) accumulates wall time and call counts, count(name, n) adds
+    to a counter and iteration(...) records one bootstrapping iteration
+    (and prints a one-line summary when echo is on). export_jsonl() writes
+    everything as JSON lines. The trainers report through the module-level
+    `telemetry` instance below.
+    """
+
+    def __init__(self, echo=True):
+        self.echo = echo
+        self.reset()
+
+    def reset(self):
+        self.timers = defaultdict(lambda: [0.0, 0])     # name -> [seconds, calls]
+        self.counters = defaultdict(int)
+        self.events = []
+        self._last = time.perf_counter()
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            t = self.timers[name]
+            t[0] += time.perf_counter() - start
+            t[1] += 1
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def iteration(self, word, iteration, labels_added, labeled, rules, **extra):
+        now = time.perf_counter()
+        event = {
+            "type": "iteration",
+            "word": word,
+            "iteration": iteration,
+            "labels_added": labels_added,
+            "labeled": labeled,
+            "rules": rules,
+            "time_s": now - self._last,
+            "rss_mb": rss_mb(),
+            **extra,
+        }
+        self._last = now
+        self.events.append(event)
+        if self.echo:
+            extras = "".join(f", {k} {v}" for k, v in extra.items())
+            print(f"  iter {iteration}: {labeled} labeled (+{labels_added}), {rules} rules{extras}, "
+                  f"{event['time_s']:.3f}s")
+        return event
+
+    def mark(self):
+        """Start the clock of the next iteration event (e.g. at the start of a word)."""
+        self._last = time.perf_counter()
+
+    def drain(self):
+        """Hand this process's measurements to another (see merge) and reset."""
+        state = (dict(self.timers), dict(self.counters), self.events)
+        self.reset()
+        return state
+
+    def merge(self, state):
+        timers, counters, events = state
+        for name, (seconds, calls) in timers.items():
+            t = self.timers[name]
+            t[0] += seconds
+            t[1] += calls
+        for name, n in counters.items():
+            self.counters[name] += n
+        self.events.extend(events)
+
+    def records(self):
+        yield from self.events
+        for name, (seconds, calls) in sorted(self.timers.items()):
+            yield {"type": "timer", "name": name, "total_s": seconds, "calls": calls}
+        for name, n in sorted(self.counters.items()):
+            yield {"type": "counter", "name": name, "value": n}
+
+    def export_jsonl(self, path):
+        with open(path, "w") as f:
+            for record in self.records():
+                f.write(json.dumps(record) + "\n")
+
+    def summary(self):
+        lines = [f"{'timer':24s} {'total_s':>10s} {'calls':>8s}"]
+        for name, (seconds, calls) in sorted(self.timers.items(), key=lambda kv: -kv[1][0]):
+            lines.append(f"{name:24s} {seconds:10.4f} {calls:8d}")
+        for name, n in sorted(self.counters.items()):
+            lines.append(f"{name:24s} {n:10d}")
+        return "\n".join(lines)
+
+
+telemetry = Telemetry()
+
+
+@contextmanager
+def instrumented(metrics_path=None, profile_path=None):
+    """
+    Wrap a script's main work: with profile_path, run it under cProfile and
+    dump pstats there; with metrics_path, write the telemetry as JSON lines
+    and print the timer summary at the end.
+    """
+    profiler = cProfile.Profile() if profile_path else None
+    with profiler or nullcontext():
+        yield telemetry
+    if profiler is not None:
+        profiler.dump_stats(profile_path)
+        print(f"Saved profile to {profile_path} (python -m pstats {profile_path})")
+    if metrics_path:
+        Path(metrics_path).parent.mkdir(parents=True, exist_ok=True)
+        telemetry.export_jsonl(metrics_path)
+        print(telemetry.summary())
+        print(f"Saved metrics to {metrics_path}")
+
+
+def add_arguments(parser):
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="write timers, counters and per-iteration metrics as JSON lines")
+    parser.add_argument("--profile", metavar="PATH", help="run under cProfile and dump pstats to PATH")
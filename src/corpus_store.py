@@ -0,0 +1,765 @@
+import os
+import json
+import fcntl
+import shutil
+from array import array
+from bisect import bisect_right
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+
+VOCAB_FILE = "vocab.txt"
+TOKENS_FILE = "tokens.npy"
+SENT_OFFSETS_FILE = "sent_offsets.npy"
+DOC_OFFSETS_FILE = "doc_offsets.npy"
+POSTINGS_FILE = "postings.npy"
+POSTINGS_OFFSETS_FILE = "postings_offsets.npy"
+MANIFEST_FILE = "manifest.json"
+SEGMENTS_DIR = "segments"
+SEGMENT_FILES = (TOKENS_FILE, SENT_OFFSETS_FILE, DOC_OFFSETS_FILE, POSTINGS_FILE, POSTINGS_OFFSETS_FILE)
+LOAD_RETRIES = 3   # manifest changes (merges) tolerated while loading a segmented store
+
+
+class Document:
+    """One document of a Corpus: document[sent_id] is a list of token strings."""
+
+    def __init__(self, corpus, doc_id):
+        self.corpus = corpus
+        self.doc_id = doc_id
+        self.first_sent = int(corpus.doc_offsets[doc_id])
+        self.n_sents = int(corpus.doc_offsets[doc_id + 1]) - self.first_sent
+
+    def __len__(self):
+        return self.n_sents
+
+    def __getitem__(self, sent_id):
+        if not 0 <= sent_id < self.n_sents:
+            raise IndexError(sent_id)
+        return self.corpus.decode_sentence(self.first_sent + sent_id)
+
+    def __iter__(self):
+        for sent_id in range(self.n_sents):
+            yield self.corpus.decode_sentence(self.first_sent + sent_id)
+
+
+class Corpus:
+    """
+    Array-backed corpus.
+
+    tokens        : int32 token ids of every sentence, concatenated
+    sent_offsets  : start of sentence i in tokens (length n_sents + 1)
+    doc_offsets   : first sentence of document d (length n_docs + 1)
+
+    Supports the nested-list access of the old pickle: corpus[doc][sent][tok].
+    """
+
+    def __init__(self, vocab, tokens, sent_offsets, doc_offsets):
+        self.vocab = vocab
+        self.tokens = tokens
+        self.sent_offsets = sent_offsets
+        self.doc_offsets = doc_offsets
+
+    def __len__(self):
+        return len(self.doc_offsets) - 1
+
+    def __getitem__(self, doc_id):
+        if not 0 <= doc_id < len(self):
+            raise IndexError(doc_id)
+        return Document(self, doc_id)
+
+    def __iter__(self):
+        for doc_id in range(len(self)):
+            yield Document(self, doc_id)
+
+    def decode_sentence(self, sent_idx):
+        start = self.sent_offsets[sent_idx]
+        end = self.sent_offsets[sent_idx + 1]
+        vocab = self.vocab
+        return [vocab[i] for i in self.tokens[start:end].tolist()]
+
+    def locate(self, positions):
+        """Map global token positions to (doc_ids, sent_ids, tok_ids) arrays."""
+        positions = np.asarray(positions, dtype=np.int64)
+        sent_idx = np.searchsorted(self.sent_offsets, positions, side="right") - 1
+        doc_ids = np.searchsorted(self.doc_offsets, sent_idx, side="right") - 1
+        sent_ids = sent_idx - self.doc_offsets[doc_ids]
+        tok_ids = positions - self.sent_offsets[sent_idx]
+        return doc_ids, sent_ids, tok_ids
+
+    def to_lists(self):
+        return [list(doc) for doc in self]
+
+
+class OverlayDocument:
+    def __init__(self, overlay, doc_id):
+        self.overlay = overlay
+        self.doc_id = doc_id
+        self.base = overlay.base[doc_id]
+
+    def __len__(self):
+        return len(self.base)
+
+    def __getitem__(self, sent_id):
+        return self.overlay.sentence(self.doc_id, sent_id, self.base[sent_id])
+
+    def __iter__(self):
+        for sent_id in range(len(self.base)):
+            yield self[sent_id]
+
+
+class CorpusOverlay:
+    """
+    Read-through view of a base corpus with a sparse set of token
+    substitutions, stored as {(doc_id, sent_id): {tok_id: word}}. Memory is
+    proportional to the number of substitutions, not to the corpus.
+    overlay[doc][sent] is the base sentence with its substitutions applied.
+    """
+
+    def __init__(self, base, substitutions=None):
+        self.base = base
+        self.substitutions = substitutions if substitutions is not None else {}
+
+    def __len__(self):
+        return len(self.base)
+
+    def __getitem__(self, doc_id):
+        return OverlayDocument(self, doc_id)
+
+    def __iter__(self):
+        for doc_id in range(len(self.base)):
+            yield OverlayDocument(self, doc_id)
+
+    def substitute(self, doc_id, sent_id, tok_id, word):
+        self.substitutions.setdefault((doc_id, sent_id), {})[tok_id] = word
+
+    def sentence(self, doc_id, sent_id, base_sentence=None):
+        if base_sentence is None:
+            base_sentence = self.base[doc_id][sent_id]
+        subs = self.substitutions.get((doc_id, sent_id))
+        if not subs:
+            return base_sentence
+        sentence = list(base_sentence)
+        for tok_id, word in subs.items():
+            sentence[tok_id] = word
+        return sentence
+
+
+class TokenIndex:
+    """
+    CSR postings: the positions of word w are
+    postings[postings_offsets[w_id]:postings_offsets[w_id + 1]],
+    stored as global token positions in corpus order.
+
+    token_index[word] returns [(doc_id, sent_id, tok_id), ...] like the old
+    defaultdict index.
+    """
+
+    def __init__(self, corpus, postings, postings_offsets, word_ids=None):
+        self.corpus = corpus
+        self.postings = postings
+        self.postings_offsets = postings_offsets
+        if word_ids is None:
+            word_ids = {w: i for i, w in enumerate(corpus.vocab)}
+        self.word_ids = word_ids
+
+    def _bounds(self, word):
+        # A segment written before a word entered the shared vocabulary has
+        # a shorter postings_offsets array and no postings for it.
+        w_id = self.word_ids.get(word)
+        if w_id is None or w_id + 1 >= len(self.postings_offsets):
+            return 0, 0
+        return self.postings_offsets[w_id], self.postings_offsets[w_id + 1]
+
+    def __len__(self):
+        return len(self.word_ids)
+
+    def __contains__(self, word):
+        return word in self.word_ids
+
+    def __iter__(self):
+        return iter(self.word_ids)
+
+    def keys(self):
+        return self.word_ids.keys()
+
+    def count(self, word):
+        start, end = self._bounds(word)
+        return int(end - start)
+
+    def counts(self):
+        """Frequency of every word, indexed by word id."""
+        counts = np.zeros(len(self.word_ids), dtype=np.int64)
+        seg_counts = np.diff(self.postings_offsets)
+        counts[:len(seg_counts)] = seg_counts
+        return counts
+
+    def positions(self, word):
+        start, end = self._bounds(word)
+        return self.postings[start:end]
+
+    def occurrences(self, word, min_doc=0):
+        """token_index[word], restricted to documents >= min_doc."""
+        positions = self.positions(word)
+        if min_doc > 0:
+            corpus = self.corpus
+            if min_doc >= len(corpus):
+                positions = positions[:0]
+            else:
+                first = corpus.sent_offsets[corpus.doc_offsets[min_doc]]
+                positions = positions[np.searchsorted(positions, first):]
+        doc_ids, sent_ids, tok_ids = self.corpus.locate(positions)
+        return list(zip(doc_ids.tolist(), sent_ids.tolist(), tok_ids.tolist()))
+
+    def __getitem__(self, word):
+        return self.occurrences(word)
+
+    def get(self, word, default=None):
+        if word not in self.word_ids:
+            return default
+        return self[word]
+
+
+class SegmentedCorpus:
+    """
+    A corpus stored as appended segments (see --append in src/preprocess.py).
+    Segment k holds documents doc_bases[k] .. doc_bases[k] + len(segment) - 1.
+    All segments share one append-only vocabulary, so doc_ids and token ids
+    do not change when documents are appended or segments are merged.
+    """
+
+    def __init__(self, vocab, segments, doc_bases):
+        self.vocab = vocab
+        self.segments = segments
+        self.doc_bases = doc_bases
+        self.n_docs = doc_bases[-1] + len(segments[-1]) if segments else 0
+
+    def __len__(self):
+        return self.n_docs
+
+    def segment_of(self, doc_id):
+        return bisect_right(self.doc_bases, doc_id) - 1
+
+    def __getitem__(self, doc_id):
+        if not 0 <= doc_id < self.n_docs:
+            raise IndexError(doc_id)
+        k = self.segment_of(doc_id)
+        return self.segments[k][doc_id - self.doc_bases[k]]
+
+    def __iter__(self):
+        for segment in self.segments:
+            yield from segment
+
+    def to_lists(self):
+        return [list(doc) for doc in self]
+
+
+class SegmentedTokenIndex:
+    """One TokenIndex per segment of a SegmentedCorpus, queried as a single index."""
+
+    def __init__(self, corpus, indexes, word_ids):
+        self.corpus = corpus
+        self.indexes = indexes
+        self.word_ids = word_ids
+
+    def __len__(self):
+        return len(self.word_ids)
+
+    def __contains__(self, word):
+        return word in self.word_ids
+
+    def __iter__(self):
+        return iter(self.word_ids)
+
+    def keys(self):
+        return self.word_ids.keys()
+
+    def count(self, word):
+        return sum(index.count(word) for index in self.indexes)
+
+    def counts(self):
+        return sum(index.counts() for index in self.indexes)
+
+    def occurrences(self, word, min_doc=0):
+        result = []
+        for base, index in zip(self.corpus.doc_bases, self.indexes):
+            if base + len(index.corpus) <= min_doc:
+                continue
+            for doc_id, sent_id, tok_id in index.occurrences(word, max(0, min_doc - base)):
+                result.append((base + doc_id, sent_id, tok_id))
+        return result
+
+    def __getitem__(self, word):
+        return self.occurrences(word)
+
+    def get(self, word, default=None):
+        if word not in self.word_ids:
+            return default
+        return self[word]
+
+
+class FilteredTokenIndex:
+    """
+    A TokenIndex or SegmentedTokenIndex restricted to the documents with
+    keep[doc_id] set, e.g. the canonical documents of src/near_duplicates.py.
+    doc_ids are not renumbered, so positions still address the full corpus.
+    """
+
+    def __init__(self, index, keep):
+        self.index = index
+        self.corpus = index.corpus
+        self.word_ids = index.word_ids
+        self.keep = keep
+
+    def __len__(self):
+        return len(self.word_ids)
+
+    def __contains__(self, word):
+        return word in self.word_ids
+
+    def __iter__(self):
+        return iter(self.word_ids)
+
+    def keys(self):
+        return self.word_ids.keys()
+
+    def count(self, word):
+        return len(self.occurrences(word))
+
+    def counts(self):
+        counts = self.index.counts().copy()
+        dropped = np.flatnonzero(~self.keep)
+        for segment, base in corpus_segments(self.corpus):
+            local = dropped[(dropped >= base) & (dropped < base + len(segment))] - base
+            doc_offsets = np.asarray(segment.doc_offsets)
+            sent_offsets = np.asarray(segment.sent_offsets)
+            sents = _ranges(doc_offsets[local], doc_offsets[local + 1])
+            tokens = np.asarray(segment.tokens)[_ranges(sent_offsets[sents], sent_offsets[sents + 1])]
+            counts -= np.bincount(tokens, minlength=len(counts))
+        return counts
+
+    def occurrences(self, word, min_doc=0):
+        keep = self.keep
+        return [occ for occ in self.index.occurrences(word, min_doc) if keep[occ[0]]]
+
+    def __getitem__(self, word):
+        return self.occurrences(word)
+
+    def get(self, word, default=None):
+        if word not in self.word_ids:
+            return default
+        return self[word]
+
+
+def corpus_segments(corpus):
+    """[(Corpus, first doc_id), ...] of a Corpus or SegmentedCorpus."""
+    if isinstance(corpus, SegmentedCorpus):
+        return list(zip(corpus.segments, corpus.doc_bases))
+    return [(corpus, 0)]
+
+
+def _ranges(starts, ends):
+    # Concatenation of arange(s, e) for every (s, e)
+    lengths = ends - starts
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    return np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+
+
+def subset_corpus(corpus, doc_ids):
+    """A new array Corpus holding only the documents doc_ids (sorted), renumbered from 0."""
+    doc_ids = np.asarray(doc_ids, dtype=np.int64)
+    tokens = []
+    sent_lengths = []
+    doc_lengths = []
+    for segment, base in corpus_segments(corpus):
+        local = doc_ids[(doc_ids >= base) & (doc_ids < base + len(segment))] - base
+        doc_offsets = np.asarray(segment.doc_offsets)
+        sent_offsets = np.asarray(segment.sent_offsets)
+        sents = _ranges(doc_offsets[local], doc_offsets[local + 1])
+        tokens.append(np.asarray(segment.tokens)[_ranges(sent_offsets[sents], sent_offsets[sents + 1])])
+        sent_lengths.append(sent_offsets[sents + 1] - sent_offsets[sents])
+        doc_lengths.append(doc_offsets[local + 1] - doc_offsets[local])
+
+    sent_offsets = np.zeros(sum(len(a) for a in sent_lengths) + 1, dtype=np.int64)
+    np.cumsum(np.concatenate(sent_lengths), out=sent_offsets[1:])
+    doc_offsets = np.zeros(len(doc_ids) + 1, dtype=np.int64)
+    np.cumsum(np.concatenate(doc_lengths), out=doc_offsets[1:])
+    return Corpus(corpus.vocab, np.concatenate(tokens).astype(np.int32), sent_offsets, doc_offsets)
+
+
+def encode_corpus(corpus):
+    """Intern a nested-list corpus (documents -> sentences -> tokens) into a Corpus."""
+    word_ids = {}
+    tokens = array("i")
+    sent_offsets = array("q", [0])
+    doc_offsets = array("q", [0])
+
+    for document in corpus:
+        for sentence in document:
+            tokens.extend(word_ids.setdefault(tok, len(word_ids)) for tok in sentence)
+            sent_offsets.append(len(tokens))
+        doc_offsets.append(len(sent_offsets) - 1)
+
+    return Corpus(
+        list(word_ids),
+        np.frombuffer(tokens, dtype=np.int32),
+        np.frombuffer(sent_offsets, dtype=np.int64),
+        np.frombuffer(doc_offsets, dtype=np.int64),
+    )
+
+
+def build_postings(tokens, vocab_size):
+    # A stable sort keeps each word's positions in corpus order.
+    postings = np.argsort(tokens, kind="stable").astype(np.int64)
+    counts = np.bincount(tokens, minlength=vocab_size)
+    postings_offsets = np.zeros(vocab_size + 1, dtype=np.int64)
+    np.cumsum(counts, out=postings_offsets[1:])
+    return postings, postings_offsets
+
+
+def write_postings(tokens, vocab_size, out_dir, chunk_size=1 << 24):
+    """
+    Counting-sort the token array into postings.npy chunk by chunk, so the
+    index of a corpus larger than memory can be built from a memory map.
+    """
+    out = Path(out_dir)
+
+    counts = np.zeros(vocab_size, dtype=np.int64)
+    for start in range(0, len(tokens), chunk_size):
+        counts += np.bincount(tokens[start:start + chunk_size], minlength=vocab_size)
+
+    postings_offsets = np.zeros(vocab_size + 1, dtype=np.int64)
+    np.cumsum(counts, out=postings_offsets[1:])
+    np.save(out / POSTINGS_OFFSETS_FILE, postings_offsets)
+
+    postings = np.lib.format.open_memmap(
+        out / POSTINGS_FILE, mode="w+", dtype=np.int64, shape=(len(tokens),)
+    )
+    cursor = postings_offsets[:-1].copy()
+    for start in range(0, len(tokens), chunk_size):
+        chunk = np.asarray(tokens[start:start + chunk_size])
+        order = np.argsort(chunk, kind="stable")
+        sorted_ids = chunk[order]
+        chunk_counts = np.bincount(chunk, minlength=vocab_size)
+        group_start = np.cumsum(chunk_counts) - chunk_counts
+        rank = np.arange(len(chunk)) - group_start[sorted_ids]
+        postings[cursor[sorted_ids] + rank] = start + order
+        cursor += chunk_counts
+    postings.flush()
+    del postings
+
+
+class CorpusWriter:
+    """
+    Append documents to an on-disk corpus store one at a time. Token ids are
+    streamed to disk as they arrive; only the vocabulary and offset arrays
+    stay in memory. close() writes the store read by load_corpus_store.
+    """
+
+    def __init__(self, out_dir, word_ids=None, vocab_dir=None):
+        self.out = Path(out_dir)
+        self.out.mkdir(parents=True, exist_ok=True)
+        # An appended segment continues the vocabulary of the store it joins.
+        self.word_ids = dict(word_ids) if word_ids else {}
+        self.vocab_dir = Path(vocab_dir) if vocab_dir is not None else self.out
+        self.sent_offsets = array("q", [0])
+        self.doc_offsets = array("q", [0])
+        self.n_tokens = 0
+        self.tmp_path = self.out / (TOKENS_FILE + ".tmp")
+        self.tmp_file = open(self.tmp_path, "wb")
+
+    def __len__(self):
+        return len(self.doc_offsets) - 1
+
+    def add_document(self, document):
+        word_ids = self.word_ids
+        buf = array("i")
+        for sentence in document:
+            buf.extend(word_ids.setdefault(tok, len(word_ids)) for tok in sentence)
+            self.sent_offsets.append(self.n_tokens + len(buf))
+        self.doc_offsets.append(len(self.sent_offsets) - 1)
+        self.n_tokens += len(buf)
+        buf.tofile(self.tmp_file)
+
+    def close(self):
+        self.tmp_file.close()
+        out = self.out
+
+        write_vocab(self.word_ids, self.vocab_dir)
+
+        if self.n_tokens:
+            tokens = np.memmap(self.tmp_path, dtype=np.int32, mode="r")
+        else:
+            tokens = np.zeros(0, dtype=np.int32)
+        np.save(out / TOKENS_FILE, tokens)
+        del tokens
+        self.tmp_path.unlink()
+
+        np.save(out / SENT_OFFSETS_FILE, np.frombuffer(self.sent_offsets, dtype=np.int64))
+        np.save(out / DOC_OFFSETS_FILE, np.frombuffer(self.doc_offsets, dtype=np.int64))
+
+        tokens = np.load(out / TOKENS_FILE, mmap_mode="r")
+        write_postings(tokens, len(self.word_ids), out)
+
+
+def write_vocab(words, out_dir):
+    # Written aside and renamed, so a reader never sees a partial vocabulary.
+    path = Path(out_dir) / VOCAB_FILE
+    tmp = path.with_name(VOCAB_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        for word in words:
+            f.write(word + "\n")
+    os.replace(tmp, path)
+
+
+def read_vocab(out_dir):
+    with open(Path(out_dir) / VOCAB_FILE, encoding="utf-8") as f:
+        return f.read().splitlines()
+
+
+def save_corpus_store(corpus, token_index, out_dir):
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+
+    write_vocab(corpus.vocab, out)
+
+    np.save(out / TOKENS_FILE, corpus.tokens)
+    np.save(out / SENT_OFFSETS_FILE, corpus.sent_offsets)
+    np.save(out / DOC_OFFSETS_FILE, corpus.doc_offsets)
+    np.save(out / POSTINGS_FILE, token_index.postings)
+    np.save(out / POSTINGS_OFFSETS_FILE, token_index.postings_offsets)
+
+
+def has_corpus_store(out_dir):
+    return (Path(out_dir) / TOKENS_FILE).exists()
+
+
+def load_corpus_store(out_dir, mmap_mode="r"):
+    out = Path(out_dir)
+
+    vocab = read_vocab(out)
+
+    corpus = Corpus(
+        vocab,
+        np.load(out / TOKENS_FILE, mmap_mode=mmap_mode),
+        np.load(out / SENT_OFFSETS_FILE, mmap_mode=mmap_mode),
+        np.load(out / DOC_OFFSETS_FILE, mmap_mode=mmap_mode),
+    )
+    token_index = TokenIndex(
+        corpus,
+        np.load(out / POSTINGS_FILE, mmap_mode=mmap_mode),
+        np.load(out / POSTINGS_OFFSETS_FILE, mmap_mode=mmap_mode),
+    )
+    return corpus, token_index
+
+
+# ==================================================================
+# Segmented store: appended documents and the manifest
+# ==================================================================
+@contextmanager
+def store_lock(out_dir, name="manifest"):
+    with open(Path(out_dir) / f".{name}.lock", "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def has_manifest(out_dir):
+    return (Path(out_dir) / MANIFEST_FILE).exists()
+
+
+def load_manifest(out_dir):
+    """
+    {"n_docs", "next_segment", "segments": [{"name", "first_doc", "n_docs"}],
+    "files": {file name: {"size", "mtime_ns", "segment"}}}, or None.
+    Segment "." is the store in out_dir itself; others live in segments/.
+    """
+    path = Path(out_dir) / MANIFEST_FILE
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, out_dir):
+    path = Path(out_dir) / MANIFEST_FILE
+    tmp = path.with_name(MANIFEST_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, path)
+
+
+def file_entry(path, segment):
+    st = Path(path).stat()
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "segment": segment}
+
+
+def new_manifest(out_dir, n_docs, files):
+    """Manifest of a freshly built store: one segment, the store in out_dir."""
+    out = Path(out_dir)
+    if (out / SEGMENTS_DIR).exists():
+        shutil.rmtree(out / SEGMENTS_DIR)
+    manifest = {
+        "n_docs": n_docs,
+        "next_segment": 1,
+        "segments": [{"name": ".", "first_doc": 0, "n_docs": n_docs}],
+        "files": {Path(p).name: file_entry(p, ".") for p in files},
+    }
+    save_manifest(manifest, out)
+    return manifest
+
+
+def segment_dir(out_dir, name):
+    return Path(out_dir) if name == "." else Path(out_dir) / SEGMENTS_DIR / name
+
+
+def reserve_segment(out_dir):
+    with store_lock(out_dir):
+        manifest = load_manifest(out_dir)
+        name = f"{manifest['next_segment']:06d}"
+        manifest["next_segment"] += 1
+        save_manifest(manifest, out_dir)
+    return name
+
+
+def commit_segment(out_dir, name, n_docs, files):
+    """Publish a written segment; its documents get the next doc_ids."""
+    with store_lock(out_dir):
+        manifest = load_manifest(out_dir)
+        first_doc = manifest["n_docs"]
+        manifest["segments"].append({"name": name, "first_doc": first_doc, "n_docs": n_docs})
+        manifest["n_docs"] += n_docs
+        for p in files:
+            manifest["files"][Path(p).name] = file_entry(p, name)
+        save_manifest(manifest, out_dir)
+    return first_doc
+
+
+def _load_segment(seg_dir, vocab, word_ids, mmap_mode):
+    arrays = {name: np.load(seg_dir / name, mmap_mode=mmap_mode) for name in SEGMENT_FILES}
+    corpus = Corpus(vocab, arrays[TOKENS_FILE], arrays[SENT_OFFSETS_FILE], arrays[DOC_OFFSETS_FILE])
+    index = TokenIndex(corpus, arrays[POSTINGS_FILE], arrays[POSTINGS_OFFSETS_FILE], word_ids=word_ids)
+    return corpus, index
+
+
+def load_segmented_store(out_dir, mmap_mode="r", retries=LOAD_RETRIES):
+    """
+    Load every segment listed in the manifest. A single segment is returned
+    as a plain Corpus / TokenIndex.
+    """
+    out = Path(out_dir)
+    for attempt in range(retries + 1):
+        manifest = load_manifest(out)
+        if manifest is None:
+            raise FileNotFoundError(f"No manifest in {out}")
+        try:
+            vocab = read_vocab(out)
+            word_ids = {w: i for i, w in enumerate(vocab)}
+            loaded = [
+                _load_segment(segment_dir(out, seg["name"]), vocab, word_ids, mmap_mode)
+                for seg in manifest["segments"]
+            ]
+            break
+        except FileNotFoundError:
+            # Retry only if a merge replaced the segments between reading
+            # the manifest and opening them; anything else is a real error.
+            if attempt == retries or load_manifest(out) == manifest:
+                raise
+
+    if len(loaded) == 1:
+        return loaded[0]
+    corpus = SegmentedCorpus(
+        vocab, [c for c, _ in loaded], [seg["first_doc"] for seg in manifest["segments"]]
+    )
+    return corpus, SegmentedTokenIndex(corpus, [index for _, index in loaded], word_ids)
+
+
+def merge_segments(out_dir, chunk_size=1 << 24):
+    """
+    Merge all current segments into one and swap it in. Safe to run in the
+    background: readers keep their memory maps of the old files, and
+    segments appended while the merge runs are kept after the merged one.
+    Returns the number of segments merged.
+    """
+    out = Path(out_dir)
+    # One merge at a time; appends only wait for the manifest swap.
+    with store_lock(out, "merge"):
+        return _merge_segments(out, chunk_size)
+
+
+def _merge_segments(out, chunk_size):
+    segments = load_manifest(out)["segments"]
+    if len(segments) < 2:
+        return 0
+    name = reserve_segment(out)
+    vocab_size = len(read_vocab(out))
+    merged_dir = segment_dir(out, name)
+    merged_dir.mkdir(parents=True, exist_ok=True)
+
+    loaded = [
+        {f: np.load(segment_dir(out, seg["name"]) / f, mmap_mode="r") for f in SEGMENT_FILES}
+        for seg in segments
+    ]
+    n_tokens = sum(len(arrays[TOKENS_FILE]) for arrays in loaded)
+
+    tokens = np.lib.format.open_memmap(
+        merged_dir / TOKENS_FILE, mode="w+", dtype=np.int32, shape=(n_tokens,)
+    )
+    sent_offsets = [np.zeros(1, dtype=np.int64)]
+    doc_offsets = [np.zeros(1, dtype=np.int64)]
+    token_base = sent_base = 0
+    for arrays in loaded:
+        seg_tokens = arrays[TOKENS_FILE]
+        for start in range(0, len(seg_tokens), chunk_size):
+            chunk = seg_tokens[start:start + chunk_size]
+            tokens[token_base + start:token_base + start + len(chunk)] = chunk
+        sent_offsets.append(arrays[SENT_OFFSETS_FILE][1:] + token_base)
+        doc_offsets.append(arrays[DOC_OFFSETS_FILE][1:] + sent_base)
+        token_base += len(seg_tokens)
+        sent_base += len(arrays[SENT_OFFSETS_FILE]) - 1
+    tokens.flush()
+    np.save(merged_dir / SENT_OFFSETS_FILE, np.concatenate(sent_offsets))
+    np.save(merged_dir / DOC_OFFSETS_FILE, np.concatenate(doc_offsets))
+    write_postings(tokens, vocab_size, merged_dir, chunk_size=chunk_size)
+    del tokens, loaded
+
+    with store_lock(out):
+        manifest = load_manifest(out)
+        if manifest["segments"][:len(segments)] != segments:
+            # The segments changed under the merge: keep them and drop the merged copy.
+            shutil.rmtree(merged_dir)
+            raise RuntimeError(f"Segments of {out} changed during the merge; merge aborted")
+        n_docs = sum(seg["n_docs"] for seg in segments)
+        manifest["segments"] = (
+            [{"name": name, "first_doc": 0, "n_docs": n_docs}] + manifest["segments"][len(segments):]
+        )
+        merged = {seg["name"] for seg in segments}
+        for entry in manifest["files"].values():
+            if entry["segment"] in merged:
+                entry["segment"] = name
+        save_manifest(manifest, out)
+
+    for seg in segments:
+        if seg["name"] == ".":
+            for f in SEGMENT_FILES:
+                (out / f).unlink()
+        else:
+            shutil.rmtree(segment_dir(out, seg["name"]))
+    return len(segments)
+
+
+def read_doc_watermark(path):
+    """Number of documents a downstream stage has processed (None if never run)."""
+    path = Path(path)
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f)["n_docs"]
+
+
+def write_doc_watermark(path, n_docs):
+    with open(path, "w") as f:
+        json.dump({"n_docs": n_docs}, f)
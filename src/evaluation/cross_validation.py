@@ -0,0 +1,174 @@
+import json
+import time
+import pickle
+import argparse
+from pathlib import Path
+from multiprocessing import Pool
+
+import numpy as np
+
+from src.synthetic_train import BOOTSTRAP_OSPD, train_single_word
+from src.synthetic_ospd import DocumentGroups, apply_ospd
+from src.evaluation.synthetic_eval import USE_OSPD, OSPD_THRESHOLD
+from src.core.decision_list import CompiledDecisionList
+from src.core.features import load_feature_sets, take_rows
+from src.core.parallel import init_worker
+
+DATA_DIR = Path("data/synthetic")
+RESULTS_FILE = DATA_DIR / "cv_results.json"
+
+FOLDS = 5
+
+
+def document_folds(n_docs, k=FOLDS, seed=0):
+    """
+    fold[doc_id] for every document: a seeded shuffle of the documents dealt
+    round-robin into k folds, so fold sizes differ by at most one document
+    and the same (n_docs, k, seed) always gives the same split. Whole
+    documents go to one fold, so OSPD never sees a test document in training.
+    """
+    fold = np.empty(n_docs, dtype=np.int32)
+    fold[np.random.default_rng(seed).permutation(n_docs)] = np.arange(n_docs) % k
+    return fold
+
+
+# Per-worker state, set by init_worker from src/core/parallel.py: memory-mapped
+# feature matrices shared through the page cache, gold labels and the fold of
+# each document.
+_feature_sets = None
+_gold = None
+_doc_fold = None
+
+
+def _set_worker_state(feature_sets, data_dir, doc_fold):
+    global _feature_sets, _gold, _doc_fold
+    _feature_sets = feature_sets
+    _gold = pickle.load(open(Path(data_dir)/"gold_labels.pkl", "rb"))
+    _doc_fold = doc_fold
+
+
+def run_fold(job):
+    """
+    Bootstrap one word on the instances outside the fold's documents, then
+    label the fold's instances with the learned list (and OSPD within them).
+    """
+    fold, word, ospd_threshold = job
+    matrix = _feature_sets[word]
+    in_fold = _doc_fold[matrix.doc_ids] == fold
+    train = {word: take_rows(matrix, np.flatnonzero(~in_fold))}
+    test = {word: take_rows(matrix, np.flatnonzero(in_fold))}
+    gold = np.asarray(_gold[word])[in_fold].tolist()
+
+    start = time.perf_counter()
+    dl = train_single_word(word, train, ospd_threshold=ospd_threshold)["decision_list"]
+    train_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    predictions = CompiledDecisionList(dl).predict_all(test[word])
+    if USE_OSPD:
+        predictions = apply_ospd(word, predictions, test, confidence_threshold=OSPD_THRESHOLD,
+                                 groups=DocumentGroups(test[word].doc_ids))
+    eval_s = time.perf_counter() - start
+
+    return {
+        "fold": fold,
+        "word": word,
+        "train_instances": len(train[word]),
+        "correct": sum(1 for p, g in zip(predictions, gold) if p == g),
+        "covered": sum(1 for p in predictions if p is not None),
+        "total": len(gold),
+        "train_s": train_s,
+        "eval_s": eval_s,
+    }
+
+
+def summarize(records, k):
+    """Per-fold totals and the mean / std / pooled accuracy and coverage over folds."""
+    folds = []
+    for fold in range(k):
+        rs = [r for r in records if r["fold"] == fold]
+        total = sum(r["total"] for r in rs)
+        folds.append({
+            "fold": fold,
+            "total": total,
+            "accuracy": sum(r["correct"] for r in rs) / total if total else None,
+            "coverage": sum(r["covered"] for r in rs) / total if total else None,
+            "train_s": sum(r["train_s"] for r in rs),
+            "eval_s": sum(r["eval_s"] for r in rs),
+        })
+
+    scored = [f for f in folds if f["total"]]
+    total = sum(r["total"] for r in records)
+    aggregate = {
+        "accuracy_mean": float(np.mean([f["accuracy"] for f in scored])),
+        "accuracy_std": float(np.std([f["accuracy"] for f in scored])),
+        "coverage_mean": float(np.mean([f["coverage"] for f in scored])),
+        "coverage_std": float(np.std([f["coverage"] for f in scored])),
+        "accuracy_pooled": sum(r["correct"] for r in records) / total,
+        "coverage_pooled": sum(r["covered"] for r in records) / total,
+        "train_s": sum(f["train_s"] for f in folds),
+        "eval_s": sum(f["eval_s"] for f in folds),
+    }
+    return folds, aggregate
+
+
+def cross_validate(targets, k=FOLDS, seed=0, workers=None, ospd_threshold=BOOTSTRAP_OSPD, data_dir=DATA_DIR):
+    """Run every (fold, word) job on a process pool; returns the per-job records in (fold, word) order."""
+    feature_sets, _ = load_feature_sets(data_dir)
+    n_docs = max(int(feature_sets[w].doc_ids.max(initial=-1)) for w in targets) + 1
+    doc_fold = document_folds(n_docs, k, seed)
+
+    # Larger words first, to keep the pool busy at the end.
+    jobs = sorted(
+        ((fold, word, ospd_threshold) for fold in range(k) for word in targets),
+        key=lambda job: -len(feature_sets[job[1]]),
+    )
+    with Pool(workers, initializer=init_worker,
+              initargs=(data_dir, True, _set_worker_state, data_dir, doc_fold)) as pool:
+        records = pool.map(run_fold, jobs)
+    order = {word: i for i, word in enumerate(targets)}
+    return sorted(records, key=lambda r: (r["fold"], order[r["word"]]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Document-level k-fold cross-validation of the synthetic pipeline.")
+    parser.add_argument("--folds", type=int, default=FOLDS)
+    parser.add_argument("--seed", type=int, default=0, help="seed of the document split")
+    parser.add_argument("--workers", type=int, default=None, help="process pool size (default: all cores)")
+    parser.add_argument("--ospd", type=float, default=BOOTSTRAP_OSPD, metavar="THRESHOLD",
+                        help="apply one-sense-per-discourse inside the bootstrapping loop")
+    parser.add_argument("--out", type=Path, default=RESULTS_FILE)
+    args = parser.parse_args()
+
+    targets = pickle.load(open(DATA_DIR/"targets.pkl", "rb"))
+    start = time.perf_counter()
+    records = cross_validate(targets, args.folds, args.seed, args.workers, args.ospd)
+    folds, aggregate = summarize(records, args.folds)
+
+    print(f"\n{args.folds}-fold cross-validation (split by document, seed {args.seed})")
+    print(f"{'fold':>4s} {'word':16s} {'train':>7s} {'test':>6s} {'acc':>7s} {'coverage':>9s} {'train_s':>8s} {'eval_s':>7s}")
+    for r in records:
+        print(f"{r['fold']:4d} {r['word']:16s} {r['train_instances']:7d} {r['total']:6d} "
+              f"{r['correct'] / max(r['total'], 1) * 100:6.2f}% {r['covered'] / max(r['total'], 1) * 100:8.2f}% "
+              f"{r['train_s']:8.3f} {r['eval_s']:7.3f}")
+
+    print()
+    for f in folds:
+        if f["total"]:
+            print(f"fold {f['fold']}: acc {f['accuracy'] * 100:6.2f}%  coverage {f['coverage'] * 100:6.2f}%  "
+                  f"train {f['train_s']:.3f}s  eval {f['eval_s']:.3f}s")
+    print(f"\nAccuracy: {aggregate['accuracy_mean'] * 100:.2f}% +/- {aggregate['accuracy_std'] * 100:.2f} "
+          f"(pooled {aggregate['accuracy_pooled'] * 100:.2f}%)")
+    print(f"Coverage: {aggregate['coverage_mean'] * 100:.2f}% +/- {aggregate['coverage_std'] * 100:.2f} "
+          f"(pooled {aggregate['coverage_pooled'] * 100:.2f}%)")
+
+    with open(args.out, "w") as f:
+        json.dump({
+            "folds": args.folds,
+            "seed": args.seed,
+            "records": records,
+            "per_fold": folds,
+            "aggregate": aggregate,
+            "wall_s": time.perf_counter() - start,
+        }, f, indent=2)
+    print(f"Saved {args.out}")
@@ -4,12 +4,12 @@ import pickle
 
 from src.preprocess import load_preprocessed_data
 from src.core.decision_list import apply_decision_list
+from src.core.features import load_feature_sets
+from src.core.model_store import load_model
 
 
 DATA_DIR = "data/preprocessed"
-FEATURE_FILE = f"{DATA_DIR}/feature_sets.pkl"
 LABEL_FILE = f"{DATA_DIR}/instances.pkl"
-DL_FILE = f"{DATA_DIR}/decision_lists.pkl"
 
 OUTPUT_FILE = "data/output/manual_evaluation_samples.csv"
 
@@ -25,9 +25,9 @@ if __name__ == "__main__":
     corpus, token_index = load_preprocessed_data(DATA_DIR)
 
     # full dicts
-    feature_sets = pickle.load(open(FEATURE_FILE, "rb"))
+    feature_sets, feature_vocab = load_feature_sets(DATA_DIR)
     labels = pickle.load(open(LABEL_FILE, "rb"))
-    decision_lists = pickle.load(open(DL_FILE, "rb"))
+    decision_lists = load_model(DATA_DIR, feature_vocab)
 
     rows = []
 
@@ -38,10 +38,9 @@ if __name__ == "__main__":
 
         fs_list = feature_sets[word]
         lb_list = labels[word]
-        dl = decision_lists[word]
 
         # run full prediction for ALL instances
-        predictions = apply_decision_list(word, feature_sets, labels, decision_lists[word]["decision_list"])
+        predictions = apply_decision_list(word, feature_sets, labels, decision_lists.decision_list(word))
 
         # choose 100 random instance indices
         total_instances = len(fs_list)
@@ -52,11 +51,9 @@ if __name__ == "__main__":
         )
 
         for idx in sample_indices:
-            entry = fs_list[idx]
-
-            doc = entry["doc_id"]
-            sent = entry["sent_id"]
-            tok = entry["tok_id"]
+            doc = int(fs_list.doc_ids[idx])
+            sent = int(fs_list.sent_ids[idx])
+            tok = int(fs_list.tok_ids[idx])
 
             predicted = predictions[idx]
 
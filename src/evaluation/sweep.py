@@ -0,0 +1,195 @@
+import csv
+import json
+import time
+import pickle
+import argparse
+import itertools
+from pathlib import Path
+from multiprocessing import Pool
+
+import numpy as np
+
+from src.preprocess import load_preprocessed_data
+from src.corpus_store import CorpusOverlay
+from src.synthetic_wsd import DATA_DIR as CORPUS_DIR, WINDOW, extract_synthetic_features
+from src.synthetic_train import LLR_SMOOTHING, MAX_ITERATIONS, train_single_word
+from src.synthetic_ospd import DocumentGroups, prediction_array, sweep_thresholds
+from src.evaluation.synthetic_eval import OSPD_THRESHOLD
+from src.core.decision_list import CompiledDecisionList
+from src.core.features import FeatureMatrix, FeatureVocab, load_feature_sets, save_feature_sets
+from src.core.parallel import init_worker
+
+DATA_DIR = Path("data/synthetic")
+CACHE_DIR = Path("data/sweep")
+RESULTS_FILE = CACHE_DIR / "results.csv"
+
+# Default grid; every combination is trained and evaluated.
+GRID = {
+    "window": [2, 3, 4, 5, 6],
+    "smoothing": [0.01, 0.1, 0.5, 1.0],
+    "iterations": [5, 10, 20],
+    "ospd_threshold": [0.5, 0.55, 0.6, 0.7, 0.8, 0.9],
+}
+DEFAULTS = {"window": WINDOW, "smoothing": LLR_SMOOTHING, "iterations": MAX_ITERATIONS,
+            "ospd_threshold": OSPD_THRESHOLD}
+
+COLUMNS = ["window", "smoothing", "iterations", "ospd_threshold", "accuracy", "coverage", "train_s", "eval_s"]
+
+
+# ==================================================================
+# Widest-window features, extracted once
+# ==================================================================
+def _source_key():
+    # The cache is stale once the synthetic features are rebuilt.
+    stat = (DATA_DIR / "synthetic_overlay.pkl").stat()
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def build_cache(max_window, cache_dir=CACHE_DIR):
+    """
+    Re-extract every synthetic instance at max_window and save the matrices
+    with a distances.npy per word (the distance of every entry of indices:
+    keeping those <= w gives the window-w features in the same order).
+    Reused while the synthetic overlay is unchanged.
+    """
+    out = Path(cache_dir) / f"window_{max_window}"
+    meta_file = out / "meta.json"
+    if meta_file.exists() and json.loads(meta_file.read_text()) == {"source": _source_key()}:
+        return out
+
+    corpus, _ = load_preprocessed_data(CORPUS_DIR)
+    overlay = CorpusOverlay(corpus, pickle.load(open(DATA_DIR/"synthetic_overlay.pkl", "rb")))
+    positions, _ = load_feature_sets(DATA_DIR)
+
+    vocab = FeatureVocab()
+    feature_sets, distances = extract_synthetic_features(
+        overlay,
+        {word: (matrix.doc_ids, matrix.sent_ids, matrix.tok_ids) for word, matrix in positions.items()},
+        vocab, window=max_window, distances=True,
+    )
+
+    save_feature_sets(feature_sets, vocab, out)
+    for word, dists in distances.items():
+        np.save(out / "feature_sets" / word / "distances.npy", dists)
+    meta_file.write_text(json.dumps({"source": _source_key()}))
+    return out
+
+
+def narrow_window(matrix, distances, window):
+    """The matrix as extracted with a narrower window: entries with distance <= window, in order."""
+    keep = distances <= window
+    kept_before = np.concatenate([[0], np.cumsum(keep)])
+    return FeatureMatrix(
+        kept_before[matrix.indptr], matrix.indices[keep],
+        matrix.doc_ids, matrix.sent_ids, matrix.tok_ids, vocab=matrix.vocab,
+    )
+
+
+# ==================================================================
+# Train / eval jobs
+# ==================================================================
+_wide = None
+_distances = None
+_gold = None
+_targets = None
+
+
+def _set_worker_state(wide, cache_dir):
+    global _wide, _distances, _gold, _targets
+    _wide = wide
+    _distances = {w: np.load(Path(cache_dir) / "feature_sets" / w / "distances.npy", mmap_mode="r") for w in _wide}
+    _gold = pickle.load(open(DATA_DIR/"gold_labels.pkl", "rb"))
+    _targets = pickle.load(open(DATA_DIR/"targets.pkl", "rb"))
+
+
+def run_job(job):
+    """
+    Train every target with one (window, smoothing, iterations) setting and
+    score it at every OSPD threshold from a single tally per word. Returns
+    one row per threshold.
+    """
+    window, smoothing, iterations, thresholds = job
+    feature_sets = {w: narrow_window(_wide[w], _distances[w], window) for w in _targets}
+
+    start = time.perf_counter()
+    model = {
+        w: train_single_word(w, feature_sets, smoothing=smoothing, max_iterations=iterations)
+        for w in _targets
+    }
+    train_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    correct = np.zeros(len(thresholds), dtype=np.int64)
+    covered = np.zeros(len(thresholds), dtype=np.int64)
+    total = 0
+    for w in _targets:
+        predictions = CompiledDecisionList(model[w]["decision_list"]).predict_all(feature_sets[w])
+        groups = DocumentGroups(feature_sets[w].doc_ids)
+        c, v = sweep_thresholds(groups, prediction_array(predictions), _gold[w], thresholds)
+        correct += c
+        covered += v
+        total += len(_gold[w])
+    eval_s = time.perf_counter() - start
+
+    return [
+        {
+            "window": window, "smoothing": smoothing, "iterations": iterations, "ospd_threshold": t,
+            "accuracy": c / total, "coverage": v / total, "train_s": train_s, "eval_s": eval_s,
+        }
+        for t, c, v in zip(thresholds, correct.tolist(), covered.tolist())
+    ]
+
+
+def run_sweep(grid, workers=None, cache_dir=CACHE_DIR):
+    """Rows for every combination of the grid, sorted by descending accuracy."""
+    wide_dir = build_cache(max(grid["window"]), cache_dir)
+    thresholds = sorted(grid["ospd_threshold"])
+    jobs = [
+        (window, smoothing, iterations, thresholds)
+        for window, smoothing, iterations in itertools.product(grid["window"], grid["smoothing"], grid["iterations"])
+    ]
+
+    rows = []
+    with Pool(workers, initializer=init_worker,
+              initargs=(wide_dir, True, _set_worker_state, wide_dir)) as pool:
+        for job_rows in pool.imap_unordered(run_job, jobs):
+            rows.extend(job_rows)
+            print(f"  {len(rows) // len(thresholds)}/{len(jobs)} training settings done")
+    rows.sort(key=lambda r: (-r["accuracy"], -r["coverage"]))
+    return rows
+
+
+def print_table(rows, limit=None):
+    print(f"{'window':>6s} {'smoothing':>9s} {'iters':>5s} {'ospd':>5s} {'acc':>7s} {'coverage':>9s} "
+          f"{'train_s':>8s} {'eval_s':>7s}")
+    for r in rows[:limit]:
+        print(f"{r['window']:6d} {r['smoothing']:9g} {r['iterations']:5d} {r['ospd_threshold']:5.2f} "
+              f"{r['accuracy'] * 100:6.2f}% {r['coverage'] * 100:8.2f}% {r['train_s']:8.3f} {r['eval_s']:7.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train and evaluate the synthetic pipeline over a parameter grid.")
+    for name, values in GRID.items():
+        kind = int if name in ("window", "iterations") else float
+        parser.add_argument(f"--{name.replace('_', '-')}", nargs="+", type=kind, default=values,
+                            help=f"values to sweep (current setting: {DEFAULTS[name]})")
+    parser.add_argument("--workers", type=int, default=None, help="process pool size (default: all cores)")
+    parser.add_argument("--top", type=int, default=None, help="print only the best N rows")
+    parser.add_argument("--out", type=Path, default=RESULTS_FILE)
+    args = parser.parse_args()
+
+    grid = {name: getattr(args, name) for name in GRID}
+    n_settings = len(grid["window"]) * len(grid["smoothing"]) * len(grid["iterations"])
+    print(f"Sweeping {n_settings * len(grid['ospd_threshold'])} configurations "
+          f"({n_settings} training settings x {len(grid['ospd_threshold'])} OSPD thresholds)")
+
+    start = time.perf_counter()
+    rows = run_sweep(grid, args.workers)
+    print_table(rows, args.top)
+
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.out, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"\nSaved {args.out} ({time.perf_counter() - start:.1f}s)")
@@ -1,45 +1,136 @@
+import time
 import pickle
+import argparse
 from pathlib import Path
-from src.synthetic_ospd import apply_ospd
+import numpy as np
+from src.synthetic_ospd import DocumentGroups, apply_ospd, prediction_array, sweep_thresholds
+from src.core.decision_list import CompiledDecisionList, prune_decision_list
+from src.core.features import load_feature_sets, unique_rows
+from src.core.model_store import RULE_DTYPE, load_model
+from src.core.telemetry import telemetry, instrumented, add_arguments as add_telemetry_arguments
 
 DATA_DIR = Path("data/synthetic")
 
 USE_OSPD = True     # toggle ON/OFF easily
+OSPD_THRESHOLD = 0.55
+SWEEP_THRESHOLDS = np.round(np.arange(0.50, 1.0001, 0.05), 2)
 
-if __name__ == "__main__":
-    feature_sets = pickle.load(open(DATA_DIR/"feature_sets.pkl", "rb"))
-    gold_labels   = pickle.load(open(DATA_DIR/"gold_labels.pkl", "rb"))
-    targets       = pickle.load(open(DATA_DIR/"targets.pkl", "rb"))
-    model         = pickle.load(open(DATA_DIR/"decision_lists.pkl", "rb"))
-
-    print("\nAutomatic Evaluation Results")
-    for word in targets:
-        dl = model[word]["decision_list"]
-
-        # --- FIRST: get raw predictions ---
-        raw_predictions = []
-        for inst in feature_sets[word]:
-            feats = set(inst["features"])
-            pred = None
-            for feat, sense, score in dl:
-                if feat in feats:
-                    pred = sense
-                    break
-            raw_predictions.append(pred)
-
-        # --- OPTIONAL: apply OSPD ---
+# prune_decision_list settings compared by --prune-report
+PRUNE_GRID = [
+    {},
+    {"drop_redundant": True},
+    {"min_count": 2},
+    {"min_count": 2, "drop_redundant": True},
+    {"min_llr": 2.0, "drop_redundant": True},
+    {"top_k": 1000, "drop_redundant": True},
+    {"top_k": 200, "drop_redundant": True},
+    {"top_k": 50, "drop_redundant": True},
+    {"top_k": 10, "drop_redundant": True},
+]
+
+
+def print_sweep(word, groups, raw_predictions, gold, thresholds):
+    correct, covered = sweep_thresholds(groups, prediction_array(raw_predictions), gold, thresholds)
+    total = len(gold)
+    print(f"{word}:")
+    for t, c, v in zip(thresholds, correct.tolist(), covered.tolist()):
+        print(f"  threshold {t:.2f}: acc {c / total * 100:6.2f}%  coverage {v / total * 100:6.2f}%")
+
+
+def prune_report(word, model, feature_sets, gold, groups, grid=PRUNE_GRID, repeat=3):
+    """
+    Rule count, size in the binary model, prediction time (best of repeat) and
+    accuracy / coverage after OSPD for each pruning setting of one word.
+    """
+    total = len(gold)
+    decision_list = model.decision_list(word)
+    rows = []
+    for options in grid:
+        rules = prune_decision_list(decision_list, feature_sets[word], model.labels(word), **options)
+        elapsed = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            predictions = CompiledDecisionList(rules).predict_all(feature_sets[word])
+            t = time.perf_counter() - start
+            elapsed = t if elapsed is None else min(elapsed, t)
         if USE_OSPD:
-            predictions = apply_ospd(word, raw_predictions, feature_sets)
-        else:
-            predictions = raw_predictions
+            predictions = apply_ospd(word, predictions, feature_sets,
+                                     confidence_threshold=OSPD_THRESHOLD, groups=groups)
+        rows.append({
+            "options": ", ".join(f"{k}={v}" for k, v in options.items()) or "none",
+            "rules": len(rules),
+            "size_kb": len(rules) * RULE_DTYPE.itemsize / 1024,
+            "predict_ms": elapsed * 1000,
+            "acc": sum(1 for p, g in zip(predictions, gold) if p == g) / total * 100,
+            "coverage": sum(1 for p in predictions if p is not None) / total * 100,
+        })
+
+    print(f"{word}:")
+    print(f"  {'pruning':42s} {'rules':>7s} {'size_kb':>9s} {'predict_ms':>11s} {'acc':>7s} {'coverage':>9s}")
+    for r in rows:
+        print(f"  {r['options']:42s} {r['rules']:7d} {r['size_kb']:9.1f} {r['predict_ms']:11.3f} "
+              f"{r['acc']:6.2f}% {r['coverage']:8.2f}%")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sweep", nargs="*", type=float, default=None,
+                        help="report OSPD accuracy/coverage for these thresholds (default grid 0.50..1.00)")
+    parser.add_argument("--dedup", action="store_true",
+                        help="apply the rules once per distinct context and copy the result to its duplicates")
+    parser.add_argument("--prune-report", action="store_true",
+                        help="compare rule count, model size, prediction time and accuracy across PRUNE_GRID")
+    add_telemetry_arguments(parser)
+    args = parser.parse_args()
+
+    with instrumented(args.metrics, args.profile):
+        with telemetry.timer("load"):
+            feature_sets, feature_vocab = load_feature_sets(DATA_DIR)
+            gold_labels   = pickle.load(open(DATA_DIR/"gold_labels.pkl", "rb"))
+            targets       = pickle.load(open(DATA_DIR/"targets.pkl", "rb"))
+            model         = load_model(DATA_DIR, feature_vocab)
+
+        print("\nAutomatic Evaluation Results")
+        for word in targets:
+            dl = CompiledDecisionList(model.decision_list(word))
+
+            # --- FIRST: get raw predictions ---
+            with telemetry.timer("apply_rules"):
+                if args.dedup:
+                    unique, inverse, _ = unique_rows(feature_sets[word])
+                    unique_predictions = dl.predict_all(unique)
+                    raw_predictions = [unique_predictions[u] for u in inverse.tolist()]
+                else:
+                    raw_predictions = dl.predict_all(feature_sets[word])
+            groups = DocumentGroups(feature_sets[word].doc_ids)
+
+            if args.sweep is not None:
+                with telemetry.timer("ospd_sweep"):
+                    print_sweep(word, groups, raw_predictions, gold_labels[word], args.sweep or SWEEP_THRESHOLDS)
+                continue
+
+            if args.prune_report:
+                with telemetry.timer("prune_report"):
+                    prune_report(word, model, feature_sets, gold_labels[word], groups)
+                continue
+
+            # --- OPTIONAL: apply OSPD ---
+            if USE_OSPD:
+                with telemetry.timer("ospd"):
+                    predictions = apply_ospd(word, raw_predictions, feature_sets,
+                                             confidence_threshold=OSPD_THRESHOLD, groups=groups)
+            else:
+                predictions = raw_predictions
 
-        # --- compute accuracy ---
-        correct = sum(
-            1 for p, g in zip(predictions, gold_labels[word]) if p == g
-        )
-        total = len(gold_labels[word])
-        acc = correct/total * 100
+            # --- compute accuracy ---
+            correct = sum(
+                1 for p, g in zip(predictions, gold_labels[word]) if p == g
+            )
+            total = len(gold_labels[word])
+            acc = correct/total * 100
+            telemetry.count("instances", total)
 
-        print(f"{word}: {correct}/{total} = {acc:.2f}%")
+            print(f"{word}: {correct}/{total} = {acc:.2f}%")
 
-    print("\nDone.")
\ No newline at end of file
+        print("\nDone.")
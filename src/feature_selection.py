@@ -1,9 +1,20 @@
 import pickle
+import argparse
 from pathlib import Path
+
+import numpy as np
+
 from src.preprocess import load_preprocessed_data
+from src.corpus_store import read_doc_watermark, write_doc_watermark
+from src.core.extract import extract_feature_matrices
+from src.core.features import FeatureVocab, concat_feature_matrices, load_feature_sets, save_feature_sets
 
 
 DATA_DIR = Path("data/preprocessed")
+WATERMARK_FILE = "feature_sets_docs.json"
+WINDOW = 3
+# Collocation 1 - immediate left and right, then collocation 2 - second-level context
+COLLOCATIONS = (("LEFT1", -1), ("RIGHT1", 1), ("LEFT2", -2), ("RIGHT2", 2))
 
 def extract_features_for_instance(corpus, instance, window=3):
     doc_id = instance["doc_id"]
@@ -41,26 +52,25 @@ def extract_features_for_instance(corpus, instance, window=3):
     return features
 
 
-def build_feature_sets(corpus, instances, window=3):
-    feature_sets = {}
-
-    for word, occs in instances.items():
-        print(f"Extracting features for '{word}'...")
-
-        feature_sets[word] = []
-
-        for inst in occs:
-            feats = extract_features_for_instance(corpus, inst, window=window)
-            feature_sets[word].append({
-                "doc_id": inst["doc_id"],
-                "sent_id": inst["sent_id"],
-                "tok_id": inst["tok_id"],
-                "features": feats,
-            })
-
-    return feature_sets
+def build_feature_sets(corpus, instances, vocab, window=3):
+    """
+    Return {word: FeatureMatrix}; feature strings are interned in vocab.
+    All words are extracted in one pass with extract_feature_matrices;
+    the features are those of extract_features_for_instance, in its order.
+    """
+    print(f"Extracting features for {len(instances)} words...")
+    positions = {
+        word: tuple(np.array([inst[key] for inst in occs], dtype=np.int64) for key in ("doc_id", "sent_id", "tok_id"))
+        for word, occs in instances.items()
+    }
+    return extract_feature_matrices(corpus, positions, vocab, COLLOCATIONS, window)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--new-only", action="store_true",
+                        help="extract only instances in documents appended since the last run")
+    args = parser.parse_args()
+
     corpus, token_index = load_preprocessed_data(DATA_DIR)
 
     with open(DATA_DIR / "targets.pkl", "rb") as f:
@@ -68,9 +78,24 @@ if __name__ == "__main__":
     with open(DATA_DIR / "instances.pkl", "rb") as f:
         instances = pickle.load(f)
 
-    feature_sets = build_feature_sets(corpus, instances, window=3)
-
-    with open(DATA_DIR / "feature_sets.pkl", "wb") as f:
-        pickle.dump(feature_sets, f)
-
-    print("\nSaved feature_sets.pkl")
+    min_doc = read_doc_watermark(DATA_DIR / WATERMARK_FILE) if args.new_only else None
+    if min_doc is None:
+        feature_vocab = FeatureVocab()
+        feature_sets = build_feature_sets(corpus, instances, feature_vocab, window=WINDOW)
+    else:
+        # Loaded into memory, not mapped: the same files are rewritten below.
+        feature_sets, feature_vocab = load_feature_sets(DATA_DIR, mmap_mode=None)
+        new_instances = {
+            word: [inst for inst in occs if inst["doc_id"] >= min_doc]
+            for word, occs in instances.items()
+        }
+        new_sets = build_feature_sets(corpus, new_instances, feature_vocab, window=WINDOW)
+        for word, matrix in new_sets.items():
+            if word in feature_sets:
+                matrix = concat_feature_matrices(feature_sets[word], matrix)
+            feature_sets[word] = matrix
+
+    save_feature_sets(feature_sets, feature_vocab, DATA_DIR)
+    write_doc_watermark(DATA_DIR / WATERMARK_FILE, len(corpus))
+
+    print(f"\nSaved feature_sets ({len(feature_vocab)} distinct features)")
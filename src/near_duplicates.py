@@ -0,0 +1,218 @@
+import argparse
+from pathlib import Path
+from multiprocessing import Pool
+
+import numpy as np
+
+from src.corpus_store import (
+    FilteredTokenIndex, TokenIndex, build_postings, corpus_segments, has_manifest,
+    load_corpus_store, load_segmented_store, save_corpus_store, subset_corpus,
+)
+
+CANONICAL_FILE = "doc_canonical.npy"   # canonical[doc_id]: the doc_id that represents its cluster
+SOURCE_DOCS_FILE = "source_doc_ids.npy"
+
+SHINGLE = 3          # tokens per shingle
+NUM_PERM = 128       # MinHash signature length
+BANDS = 16           # LSH bands of NUM_PERM // BANDS rows: pairs above ~0.7 similarity become candidates
+THRESHOLD = 0.8      # estimated Jaccard similarity at which two documents are near-duplicates
+CHUNK_DOCS = 2000    # documents per signature task
+SEED = 0
+
+EMPTY = np.iinfo(np.uint64).max
+_SEEDS = np.random.default_rng(SEED).integers(0, EMPTY, NUM_PERM, dtype=np.uint64, endpoint=True)
+
+
+def _mix(x):
+    # splitmix64 finalizer over a uint64 array (wrapping arithmetic)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def minhash_signatures(segment, lo, hi, num_perm=NUM_PERM, k=SHINGLE):
+    """
+    (num_perm, hi - lo) MinHash signatures of documents lo..hi - 1 of one
+    array Corpus, over the hashed k-token shingles inside each document.
+    Documents shorter than k tokens get EMPTY signatures.
+    """
+    doc_tokens = np.asarray(segment.sent_offsets)[np.asarray(segment.doc_offsets)[lo:hi + 1]]
+    tokens = np.asarray(segment.tokens[doc_tokens[0]:doc_tokens[-1]]).astype(np.uint64)
+    bounds = doc_tokens - doc_tokens[0]
+    signatures = np.full((num_perm, hi - lo), EMPTY, dtype=np.uint64)
+
+    n = len(tokens) - k + 1
+    if n <= 0:
+        return signatures
+    shingles = np.zeros(n, dtype=np.uint64)
+    for j in range(k):
+        shingles = _mix(shingles ^ tokens[j:j + n])
+
+    start = np.arange(n)
+    doc = np.searchsorted(bounds, start, side="right") - 1
+    inside = start + k <= bounds[doc + 1]
+    shingles = shingles[inside]
+    docs, first = np.unique(doc[inside], return_index=True)
+    if not len(docs):
+        return signatures
+
+    for i in range(num_perm):
+        signatures[i, docs] = np.minimum.reduceat(_mix(shingles ^ _SEEDS[i]), first)
+    return signatures
+
+
+def load_store(store_dir):
+    """Memory-mapped corpus of an array store, with or without appended segments."""
+    load = load_segmented_store if has_manifest(store_dir) else load_corpus_store
+    return load(store_dir)[0]
+
+
+_corpus = None
+
+
+def _init_worker(store_dir):
+    global _corpus
+    _corpus = load_store(store_dir)
+
+
+def _signature_task(task):
+    seg, lo, hi = task
+    segment, base = corpus_segments(_corpus)[seg]
+    return base + lo, minhash_signatures(segment, lo, hi)
+
+
+def corpus_signatures(store_dir, workers=1, chunk_docs=CHUNK_DOCS):
+    """Signatures of every document of the store, computed chunk by chunk on a process pool."""
+    _init_worker(store_dir)
+    n_docs = len(_corpus)
+    tasks = [
+        (seg, lo, min(lo + chunk_docs, len(segment)))
+        for seg, (segment, _) in enumerate(corpus_segments(_corpus))
+        for lo in range(0, len(segment), chunk_docs)
+    ]
+
+    signatures = np.empty((NUM_PERM, n_docs), dtype=np.uint64)
+    if workers > 1:
+        with Pool(workers, initializer=_init_worker, initargs=(store_dir,)) as pool:
+            results = pool.imap_unordered(_signature_task, tasks)
+            for first, chunk in results:
+                signatures[:, first:first + chunk.shape[1]] = chunk
+    else:
+        for first, chunk in map(_signature_task, tasks):
+            signatures[:, first:first + chunk.shape[1]] = chunk
+    return signatures
+
+
+def candidate_pairs(signatures, bands=BANDS):
+    """
+    Distinct (a, b) pairs, a < b, that share a bucket in at least one LSH
+    band. Within a bucket each document is paired with the next one, so the
+    number of pairs stays linear in the number of documents.
+    """
+    num_perm, _ = signatures.shape
+    rows = num_perm // bands
+    docs = np.flatnonzero(signatures[0] != EMPTY)
+
+    pairs = []
+    for b in range(bands):
+        key = np.zeros(len(docs), dtype=np.uint64)
+        for r in range(b * rows, (b + 1) * rows):
+            key = _mix(key ^ signatures[r, docs])
+        order = np.argsort(key, kind="stable")
+        same = key[order[1:]] == key[order[:-1]]
+        pairs.append(np.stack([docs[order[:-1][same]], docs[order[1:][same]]], axis=1))
+    if not pairs:
+        return np.empty((0, 2), dtype=np.int64)
+    return np.unique(np.concatenate(pairs), axis=0)
+
+
+def similar_pairs(signatures, pairs, threshold=THRESHOLD, chunk=100_000):
+    """The candidate pairs whose estimated Jaccard similarity (share of equal signature rows) reaches threshold."""
+    keep = np.zeros(len(pairs), dtype=bool)
+    for start in range(0, len(pairs), chunk):
+        a, b = pairs[start:start + chunk].T
+        keep[start:start + chunk] = (signatures[:, a] == signatures[:, b]).mean(axis=0) >= threshold
+    return pairs[keep]
+
+
+def canonical_docs(n_docs, pairs):
+    """
+    canonical[doc_id] for the clusters the pairs connect: the smallest doc_id
+    of each cluster, so the first version of a re-sent story is kept and
+    existing doc_ids of canonical documents do not change on append.
+    """
+    parent = list(range(n_docs))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b in pairs.tolist():
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[max(ra, rb)] = min(ra, rb)
+    return np.array([find(x) for x in range(n_docs)], dtype=np.int64)
+
+
+def find_near_duplicates(store_dir, workers=1, threshold=THRESHOLD):
+    """Cluster the store's near-duplicate documents and save canonical[doc_id] as CANONICAL_FILE."""
+    signatures = corpus_signatures(store_dir, workers)
+    pairs = similar_pairs(signatures, candidate_pairs(signatures), threshold)
+    canonical = canonical_docs(signatures.shape[1], pairs)
+    np.save(Path(store_dir) / CANONICAL_FILE, canonical)
+    return canonical
+
+
+def load_canonical(store_dir):
+    path = Path(store_dir) / CANONICAL_FILE
+    return np.load(path) if path.exists() else None
+
+
+def deduplicated_index(token_index, canonical):
+    """The token index restricted to the canonical documents; doc_ids are unchanged."""
+    return FilteredTokenIndex(token_index, canonical == np.arange(len(canonical)))
+
+
+def write_deduplicated_store(corpus, canonical, out_dir):
+    """
+    Write the canonical documents as a new array store in out_dir, with
+    SOURCE_DOCS_FILE mapping its doc_ids back to the original ones.
+    """
+    keep = np.flatnonzero(canonical == np.arange(len(canonical)))
+    subset = subset_corpus(corpus, keep)
+    postings, postings_offsets = build_postings(subset.tokens, len(subset.vocab))
+    save_corpus_store(subset, TokenIndex(subset, postings, postings_offsets), out_dir)
+    np.save(Path(out_dir) / SOURCE_DOCS_FILE, keep)
+    return len(keep)
+
+
+def summarize(canonical):
+    n_docs = len(canonical)
+    sizes = np.bincount(canonical, minlength=n_docs)
+    return {
+        "documents": n_docs,
+        "canonical": int((canonical == np.arange(n_docs)).sum()),
+        "clusters": int((sizes > 1).sum()),
+        "largest_cluster": int(sizes.max(initial=0)),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find near-duplicate documents with MinHash / LSH.")
+    parser.add_argument("--out-dir", default="data/preprocessed", help="corpus store to scan")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--dedup-out", metavar="DIR",
+                        help="also write a store with only the canonical documents to DIR")
+    args = parser.parse_args()
+
+    canonical = find_near_duplicates(args.out_dir, args.workers, args.threshold)
+    stats = summarize(canonical)
+    print(f"{stats['documents'] - stats['canonical']} of {stats['documents']} documents are near-duplicates "
+          f"({stats['clusters']} clusters); saved {Path(args.out_dir) / CANONICAL_FILE}")
+
+    if args.dedup_out:
+        n = write_deduplicated_store(load_store(args.out_dir), canonical, args.dedup_out)
+        print(f"Wrote {n} canonical documents to {args.dedup_out}")
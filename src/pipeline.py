@@ -0,0 +1,272 @@
+import sys
+import json
+import hashlib
+import argparse
+import subprocess
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+STATE_DIR = Path("data/.pipeline")
+CORPUS_DIR = "Corpus-spell-AP88"
+CORE_CODE = [
+    "src/core/features.py", "src/core/incremental.py", "src/core/llr.py",
+    "src/core/parallel.py", "src/core/seed_matcher.py", "src/core/model_store.py",
+    "src/core/extract.py", "src/core/telemetry.py",
+]
+
+
+def _no_params():
+    return {}
+
+
+def _no_args():
+    return []
+
+
+def _preprocess_args():
+    # doc_canonical.npy is only needed when a later stage skips near-duplicates.
+    from src.utils.select_targets import SKIP_NEAR_DUPS as select_targets_skips
+    from src.synthetic_wsd import SKIP_NEAR_DUPS as synthetic_wsd_skips
+    return ["--near-dups"] if select_targets_skips or synthetic_wsd_skips else []
+
+
+def _select_targets_params():
+    from src.utils.select_targets import SKIP_NEAR_DUPS
+    return {"skip_near_dups": SKIP_NEAR_DUPS}
+
+
+def _feature_selection_params():
+    from src.feature_selection import WINDOW
+    return {"window": WINDOW}
+
+
+def _decision_list_params():
+    from src.core.decision_list import SEED_RULES, SEED_MATCH, LLR_SMOOTHING, BOOTSTRAP_OSPD
+    return {"seed_rules": SEED_RULES, "seed_match": SEED_MATCH, "llr_smoothing": LLR_SMOOTHING,
+            "bootstrap_ospd": BOOTSTRAP_OSPD}
+
+
+def _synthetic_wsd_params():
+    from src.synthetic_wsd import SYNTHETIC_PAIRS, WINDOW, STOPWORDS, SKIP_NEAR_DUPS
+    return {"pairs": SYNTHETIC_PAIRS, "window": WINDOW, "stopwords": sorted(STOPWORDS), "skip_near_dups": SKIP_NEAR_DUPS}
+
+
+def _synthetic_train_params():
+    from src.synthetic_train import SEED_RULES, SEED_MATCH, LLR_SMOOTHING, BOOTSTRAP_OSPD
+    return {"seed_rules": SEED_RULES, "seed_match": SEED_MATCH, "llr_smoothing": LLR_SMOOTHING,
+            "bootstrap_ospd": BOOTSTRAP_OSPD}
+
+
+def _synthetic_eval_params():
+    from src.evaluation.synthetic_eval import USE_OSPD, OSPD_THRESHOLD
+    return {"use_ospd": USE_OSPD, "ospd_threshold": OSPD_THRESHOLD}
+
+
+# The README pipeline as a DAG. A stage's key hashes its code, parameters,
+# raw inputs and the keys of the stages it depends on, so editing e.g. a seed
+# cue only invalidates the stages downstream of the module that holds it.
+STAGES = {
+    "preprocess": {
+        "module": "src.preprocess",
+        "args": _preprocess_args,
+        "deps": [],
+        "code": ["src/preprocess.py", "src/corpus_store.py", "src/near_duplicates.py"],
+        "inputs": [CORPUS_DIR],
+        "outputs": ["data/preprocessed/vocab.txt", "data/preprocessed/manifest.json"],
+        "params": _no_params,
+    },
+    "select_targets": {
+        "module": "src.utils.select_targets",
+        "deps": ["preprocess"],
+        "code": ["src/utils/select_targets.py"],
+        "inputs": [],
+        "outputs": ["data/preprocessed/targets.pkl", "data/preprocessed/instances.pkl"],
+        "params": _select_targets_params,
+    },
+    "feature_selection": {
+        "module": "src.feature_selection",
+        "deps": ["select_targets"],
+        "code": ["src/feature_selection.py"] + CORE_CODE,
+        "inputs": [],
+        "outputs": ["data/preprocessed/feature_vocab.txt"],
+        "params": _feature_selection_params,
+    },
+    "decision_list": {
+        "module": "src.core.decision_list",
+        "deps": ["feature_selection"],
+        "code": ["src/core/decision_list.py", "src/synthetic_ospd.py"] + CORE_CODE,
+        "inputs": [],
+        "outputs": ["data/preprocessed/decision_lists.bin", "data/preprocessed/decision_labels.pkl"],
+        "params": _decision_list_params,
+    },
+    "synthetic_wsd": {
+        "module": "src.synthetic_wsd",
+        "deps": ["preprocess"],
+        "code": ["src/synthetic_wsd.py"] + CORE_CODE,
+        "inputs": [],
+        "outputs": ["data/synthetic/feature_vocab.txt", "data/synthetic/gold_labels.pkl"],
+        "params": _synthetic_wsd_params,
+    },
+    "synthetic_train": {
+        "module": "src.synthetic_train",
+        "deps": ["synthetic_wsd"],
+        "code": ["src/synthetic_train.py", "src/synthetic_ospd.py", "src/core/decision_list.py"] + CORE_CODE,
+        "inputs": [],
+        "outputs": ["data/synthetic/decision_lists.bin", "data/synthetic/decision_labels.pkl"],
+        "params": _synthetic_train_params,
+    },
+    "synthetic_eval": {
+        "module": "src.evaluation.synthetic_eval",
+        "deps": ["synthetic_train"],
+        "code": ["src/evaluation/synthetic_eval.py", "src/synthetic_ospd.py", "src/core/decision_list.py"] + CORE_CODE,
+        "inputs": [],
+        "outputs": [],
+        "params": _synthetic_eval_params,
+    },
+}
+
+
+def _hash_file(path, h):
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+
+
+def _fingerprint_input(path, h):
+    # Raw corpus inputs can be GBs: fingerprint by name, size and mtime.
+    path = Path(path)
+    files = sorted(p for p in path.rglob("*") if p.is_file()) if path.is_dir() else [path]
+    for p in files:
+        if p.exists():
+            st = p.stat()
+            h.update(f"{p}:{st.st_size}:{st.st_mtime_ns}\n".encode())
+        else:
+            h.update(f"{p}:missing\n".encode())
+
+
+def stage_keys(stages=STAGES):
+    keys = {}
+
+    def key(name):
+        if name not in keys:
+            stage = stages[name]
+            h = hashlib.sha256(name.encode())
+            for dep in stage["deps"]:
+                h.update(key(dep).encode())
+            for path in stage["code"]:
+                _hash_file(path, h)
+            for path in stage["inputs"]:
+                _fingerprint_input(path, h)
+            h.update(json.dumps(stage.get("args", _no_args)()).encode())
+            h.update(json.dumps(stage["params"](), sort_keys=True, default=repr).encode())
+            keys[name] = h.hexdigest()
+        return keys[name]
+
+    for name in stages:
+        key(name)
+    return keys
+
+
+def _stamp_path(name):
+    return STATE_DIR / f"{name}.json"
+
+
+def is_up_to_date(name, key, stages=STAGES):
+    stamp = _stamp_path(name)
+    if not stamp.exists():
+        return False
+    with open(stamp) as f:
+        if json.load(f)["key"] != key:
+            return False
+    return all(Path(p).exists() for p in stages[name]["outputs"])
+
+
+def _ancestors(names, stages=STAGES):
+    needed = set()
+    stack = list(names)
+    while stack:
+        name = stack.pop()
+        if name not in needed:
+            needed.add(name)
+            stack.extend(stages[name]["deps"])
+    return needed
+
+
+def run_stage(name, key, stages=STAGES):
+    STATE_DIR.mkdir(parents=True, exist_ok=True)
+    log_path = STATE_DIR / f"{name}.log"
+    with open(log_path, "w") as log:
+        result = subprocess.run(
+            [sys.executable, "-m", stages[name]["module"], *stages[name].get("args", _no_args)()],
+            stdout=log, stderr=subprocess.STDOUT,
+        )
+    if result.returncode != 0:
+        raise RuntimeError(f"Stage '{name}' failed, see {log_path}")
+
+    with open(_stamp_path(name), "w") as f:
+        json.dump({"key": key, "params": stages[name]["params"]()}, f, indent=2, default=repr)
+
+
+def run_pipeline(targets=None, jobs=2, force=(), dry_run=False, stages=STAGES):
+    """
+    Run the stages needed for targets (default: all), skipping stages whose
+    stored key matches. Stages whose dependencies are done run concurrently
+    on up to `jobs` subprocesses. Returns the names of the stages that ran.
+    """
+    needed = _ancestors(targets or list(stages), stages)
+    keys = stage_keys(stages)
+    stale = {
+        name for name in needed
+        if name in force or not is_up_to_date(name, keys[name], stages)
+    }
+    # A stage that reruns makes every stage that depends on it rerun too.
+    changed = True
+    while changed:
+        changed = False
+        for name in needed - stale:
+            if any(dep in stale for dep in stages[name]["deps"]):
+                stale.add(name)
+                changed = True
+
+    for name in stages:
+        if name in needed:
+            print(f"{name:18s} {'run' if name in stale else 'up to date'}")
+    if dry_run or not stale:
+        return []
+
+    done = needed - stale
+    ran = []
+    running = {}
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        while len(ran) < len(stale):
+            for name in stages:
+                if (name in stale and name not in ran and name not in running.values()
+                        and all(dep in done for dep in stages[name]["deps"])):
+                    print(f"[start] {name}")
+                    running[pool.submit(run_stage, name, keys[name], stages)] = name
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                future.result()
+                print(f"[done]  {name}")
+                done.add(name)
+                ran.append(name)
+
+    return ran
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the WSD pipeline, skipping up-to-date stages.")
+    parser.add_argument("targets", nargs="*",
+                        help=f"stages to bring up to date (default: all): {', '.join(STAGES)}")
+    parser.add_argument("--jobs", type=int, default=2, help="stages to run concurrently")
+    parser.add_argument("--force", nargs="*", default=[], choices=list(STAGES),
+                        help="rerun these stages even if up to date")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    for name in args.targets:
+        if name not in STAGES:
+            parser.error(f"unknown stage: {name}")
+
+    run_pipeline(args.targets, jobs=args.jobs, force=set(args.force), dry_run=args.dry_run)
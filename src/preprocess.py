@@ -1,13 +1,23 @@
 import re
+import sys
 import pickle
+import argparse
+import subprocess
 from pathlib import Path
-from collections import defaultdict
+from multiprocessing import Pool
 
-import re
-import pickle
-from pathlib import Path
-from collections import defaultdict
+from src.corpus_store import (
+    CorpusWriter, TokenIndex, build_postings, encode_corpus,
+    save_corpus_store, load_corpus_store, has_corpus_store,
+    load_manifest, has_manifest, new_manifest, load_segmented_store, merge_segments,
+    reserve_segment, commit_segment, segment_dir, read_vocab, store_lock,
+)
+from src.near_duplicates import (
+    CANONICAL_FILE, deduplicated_index, find_near_duplicates, load_canonical, summarize as summarize_near_duplicates,
+)
 
+# Appending beyond this many segments starts a background merge.
+MAX_SEGMENTS = 4
 
 TEXT_REGEX = re.compile(r'<TEXT[^>]*>(.*?)</TEXT>', re.DOTALL | re.IGNORECASE)
 SENT_SPLIT_REGEX = re.compile(r'(?<=[.!?])\s+')
@@ -15,7 +25,8 @@ TOKEN_REGEX = re.compile(r'\b[a-zA-Z]+\b')
 
 
 def read_files(input_dir):
-    for file_path in Path(input_dir).glob("*"):
+    # Sorted like build_corpus_parallel, so doc_ids do not depend on --workers.
+    for file_path in sorted(p for p in Path(input_dir).glob("*") if p.is_file()):
         with open(file_path, 'r', encoding='latin-1', errors='ignore') as f:
             yield f.read()
 
@@ -57,14 +68,127 @@ def build_corpus(input_dir):
 
 
 def build_token_index(corpus):
-    index = defaultdict(list)
+    """
+    CSR postings over an encoded Corpus (see src/corpus_store.py).
+    token_index[word] -> [(doc_id, sent_id, token_id), ...]
+    """
+    postings, postings_offsets = build_postings(corpus.tokens, len(corpus.vocab))
+    return TokenIndex(corpus, postings, postings_offsets)
+
+
+def iter_raw_blocks(file_path):
+    """
+    Stream a corpus file, yielding one chunk of raw lines per closing
+    </TEXT> tag instead of reading the whole file with f.read().
+    """
+    buf = []
+    with open(file_path, 'r', encoding='latin-1', errors='ignore') as f:
+        for line in f:
+            buf.append(line)
+            if '</text>' in line.lower():
+                yield ''.join(buf)
+                buf = []
+    if buf:
+        yield ''.join(buf)
+
+
+def iter_file_documents(file_path):
+    for raw in iter_raw_blocks(file_path):
+        for block in extract_texts(raw):
+            tokenized = tokenize_text(clean_text(block))
+            if tokenized:
+                yield tokenized
+
+
+def _write_shard(task):
+    file_path, shard_path = task
+    documents = list(iter_file_documents(file_path))
+    with open(shard_path, 'wb') as f:
+        pickle.dump(documents, f)
+    return shard_path
+
+
+def ingest_files(files, writer, shard_dir, workers=None):
+    """
+    Tokenize files across a process pool. Each worker writes the documents
+    of one file to a shard; shards are added to the writer in file order as
+    soon as they are ready, so doc_ids are deterministic and at most a few
+    files' worth of documents is held in memory at once.
+    """
+    shard_dir = Path(shard_dir)
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    tasks = [(p, shard_dir / f'{i:06d}.pkl') for i, p in enumerate(files)]
+
+    with Pool(workers) as pool:
+        for shard_path in pool.imap(_write_shard, tasks):
+            with open(shard_path, 'rb') as f:
+                for document in pickle.load(f):
+                    writer.add_document(document)
+            shard_path.unlink()
+    shard_dir.rmdir()
+
+
+def build_corpus_parallel(input_dir, out_dir, workers=None):
+    """Build the array store from input_dir with ingest_files, in sorted file order."""
+    out = Path(out_dir)
+    files = sorted(p for p in Path(input_dir).glob("*") if p.is_file())
+
+    writer = CorpusWriter(out)
+    ingest_files(files, writer, out / 'shards', workers=workers)
+    writer.close()
+    new_manifest(out, len(writer), files)
+
+    return len(writer)
+
 
-    for doc_id, document in enumerate(corpus):
-        for sent_id, sentence in enumerate(document):
-            for token_id, token in enumerate(sentence):
-                index[token].append((doc_id, sent_id, token_id))
+def append_corpus(input_dir, out_dir, workers=None):
+    """
+    Ingest the files of input_dir that the manifest does not list yet into a
+    new segment; existing tokens and postings are not touched. The new
+    documents get the doc_ids following the current ones.
 
-    return index
+    Returns (first_doc, n_docs) of the appended documents, or None.
+    """
+    out = Path(out_dir)
+    # Appends are serialized: each one extends the shared vocabulary.
+    with store_lock(out, "append"):
+        return _append_files(out, input_dir, workers)
+
+
+def _append_files(out, input_dir, workers):
+    manifest = load_manifest(out)
+    if manifest is None:
+        raise FileNotFoundError(f"No manifest in {out}; build the corpus once without --append")
+
+    files = []
+    for p in sorted(p for p in Path(input_dir).glob("*") if p.is_file()):
+        entry = manifest["files"].get(p.name)
+        if entry is None:
+            files.append(p)
+        elif (entry["size"], entry["mtime_ns"]) != (p.stat().st_size, p.stat().st_mtime_ns):
+            print(f"Warning: {p.name} changed since it was ingested; rebuild to pick up the change")
+    if not files:
+        return None
+
+    name = reserve_segment(out)
+    seg_dir = segment_dir(out, name)
+    # The vocabulary grows in place, so existing token ids stay valid.
+    writer = CorpusWriter(seg_dir, word_ids={w: i for i, w in enumerate(read_vocab(out))}, vocab_dir=out)
+    ingest_files(files, writer, seg_dir / 'shards', workers=workers)
+    writer.close()
+
+    first_doc = commit_segment(out, name, len(writer), files)
+    return first_doc, len(writer)
+
+
+def start_background_merge(out_dir):
+    """Merge the store's segments in a detached process, logging to merge.log."""
+    out = Path(out_dir)
+    with open(out / 'merge.log', 'ab') as log:
+        subprocess.Popen(
+            [sys.executable, '-m', 'src.preprocess', '--merge', '--out-dir', str(out)],
+            stdout=log, stderr=subprocess.STDOUT, start_new_session=True,
+        )
 
 
 def get_context(corpus, doc_id, sent_id, token_id, window_size=2):
@@ -77,19 +201,35 @@ def get_context(corpus, doc_id, sent_id, token_id, window_size=2):
 
 
 def save_preprocessed_data(corpus, token_index, out_dir):
-    out = Path(out_dir)
-    out.mkdir(parents=True, exist_ok=True)
+    save_corpus_store(corpus, token_index, out_dir)
 
-    with open(out / 'corpus.pkl', 'wb') as f:
-        pickle.dump(corpus, f)
 
-    with open(out / 'token_index.pkl', 'wb') as f:
-        pickle.dump(token_index, f)
+def load_preprocessed_data(out_dir, skip_near_dups=False):
+    """
+    Memory-map the array corpus and token index written by
+    save_preprocessed_data, including any appended segments. Falls back to
+    the legacy corpus.pkl / token_index.pkl pickles if the directory
+    predates the array format.
 
-
-def load_preprocessed_data(out_dir):
+    With skip_near_dups, the token index only returns occurrences in
+    canonical documents (doc_canonical.npy, written by --near-dups), so
+    stages that collect instances from it skip near-duplicate documents. The
+    corpus and its doc_ids are unchanged.
+    """
     out = Path(out_dir)
 
+    if has_manifest(out) or has_corpus_store(out):
+        corpus, token_index = load_segmented_store(out) if has_manifest(out) else load_corpus_store(out)
+        if not skip_near_dups:
+            return corpus, token_index
+        canonical = load_canonical(out)
+        if canonical is None or len(canonical) != len(corpus):
+            raise FileNotFoundError(
+                f"No up-to-date {CANONICAL_FILE} in {out}; run python3 -m src.preprocess --near-dups")
+        return corpus, deduplicated_index(token_index, canonical)
+    if skip_near_dups:
+        raise FileNotFoundError(f"{out} predates the array format; near-duplicate removal needs a rebuild")
+
     with open(out / 'corpus.pkl', 'rb') as f:
         corpus = pickle.load(f)
 
@@ -100,18 +240,68 @@ def load_preprocessed_data(out_dir):
 
 
 if __name__ == "__main__":
-    corpus_dir = 'Corpus-spell-AP88'
-    out_dir = "data/preprocessed"
-
-    print("Building corpus...")
-    corpus = build_corpus(corpus_dir)
-    print(f"Total documents extracted: {len(corpus)}")
-
-    print("Building token index...")
-    token_index = build_token_index(corpus)
-    print(f"Unique tokens: {len(token_index)}")
-
-    print("Saving preprocessed data...")
-    save_preprocessed_data(corpus, token_index, out_dir)
-
-    print("Done.")
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input-dir", default='Corpus-spell-AP88')
+    parser.add_argument("--out-dir", default="data/preprocessed")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="> 1 tokenizes files in parallel and streams shards to disk")
+    parser.add_argument("--append", action="store_true",
+                        help="ingest only files not yet in the manifest, as a new segment")
+    parser.add_argument("--merge", action="store_true",
+                        help="merge the appended segments into one")
+    parser.add_argument("--near-dups", action="store_true",
+                        help="cluster near-duplicate documents after building (src/near_duplicates.py)")
+    args = parser.parse_args()
+
+    corpus_dir = args.input_dir
+    out_dir = args.out_dir
+
+    if args.merge:
+        print(f"Merged {merge_segments(out_dir)} segments.")
+        sys.exit()
+
+    if args.append:
+        appended = append_corpus(corpus_dir, out_dir, workers=args.workers)
+        if appended is None:
+            print("No new files to ingest.")
+        else:
+            first_doc, n_docs = appended
+            print(f"Appended {n_docs} documents (doc_ids {first_doc}..{first_doc + n_docs - 1})")
+            if len(load_manifest(out_dir)["segments"]) > MAX_SEGMENTS:
+                print("Merging segments in the background...")
+                start_background_merge(out_dir)
+    elif args.workers > 1:
+        print(f"Building corpus with {args.workers} workers...")
+        n_docs = build_corpus_parallel(corpus_dir, out_dir, workers=args.workers)
+        print(f"Total documents extracted: {n_docs}")
+    else:
+        print("Building corpus...")
+        corpus = encode_corpus(build_corpus(corpus_dir))
+        print(f"Total documents extracted: {len(corpus)}")
+
+        print("Building token index...")
+        token_index = build_token_index(corpus)
+        print(f"Unique tokens: {len(token_index)}")
+
+        print("Saving preprocessed data...")
+        save_preprocessed_data(corpus, token_index, out_dir)
+        new_manifest(out_dir, len(corpus), [p for p in Path(corpus_dir).glob("*") if p.is_file()])
+
+    # The near-duplicate map must cover every document: recompute it when
+    # documents were appended, and drop a map left over from an earlier build.
+    canonical_path = Path(out_dir) / CANONICAL_FILE
+    near_dups = args.near_dups
+    if canonical_path.exists() and not near_dups:
+        if not args.append:
+            canonical_path.unlink()
+        elif appended is not None:
+            print(f"Documents appended; updating {CANONICAL_FILE}")
+            near_dups = True
+
+    if near_dups:
+        print("Finding near-duplicate documents...")
+        stats = summarize_near_duplicates(find_near_duplicates(out_dir, workers=args.workers))
+        print(f"{stats['documents'] - stats['canonical']} of {stats['documents']} documents are near-duplicates "
+              f"({stats['clusters']} clusters); saved {CANONICAL_FILE}")
+
+    print("Done.")
@@ -0,0 +1,250 @@
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+from pathlib import Path
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from src.preprocess import clean_text, tokenize_text
+from src.core.decision_list import CompiledDecisionList
+from src.core.features import FEATURE_VOCAB_FILE, FeatureMatrix, FeatureVocab
+from src.core.model_store import load_model
+from src import feature_selection, synthetic_wsd
+
+
+def extract_natural(corpus, doc_id, sent_id, tok_id):
+    instance = {"doc_id": doc_id, "sent_id": sent_id, "tok_id": tok_id}
+    return feature_selection.extract_features_for_instance(corpus, instance, window=feature_selection.WINDOW)
+
+
+def extract_synthetic(corpus, doc_id, sent_id, tok_id):
+    return synthetic_wsd.extract_features(corpus, doc_id, sent_id, tok_id)
+
+
+# The synthetic model's targets are pseudowords, which raw text never
+# contains: its source words are conflated into them first, as in training.
+PSEUDOWORDS = {w: synth for synth, words in synthetic_wsd.SYNTHETIC_PAIRS.items() for w in words}
+
+# model name -> (directory with the trained model,
+#                the feature extractor its feature sets were built with,
+#                {text word: target word} substituted before extraction)
+MODELS = {
+    "natural": (Path("data/preprocessed"), extract_natural, None),
+    "synthetic": (Path("data/synthetic"), extract_synthetic, PSEUDOWORDS),
+}
+
+MAX_BATCH = 512        # texts per micro-batch
+MAX_WAIT_MS = 2.0      # how long a batch waits for more requests
+
+
+class Disambiguator:
+    """
+    Loads a trained model once and labels every target word occurrence in
+    batches of raw text. Texts are tokenized with the src/preprocess.py
+    rules, words in substitutions are replaced by their target word, and
+    the sentences are featurized with the extractor the model was trained
+    with; each target word's occurrences are labeled together with the
+    compiled rule index of CompiledDecisionList.
+    """
+
+    def __init__(self, data_dir, extract_fn, substitutions=None):
+        data_dir = Path(data_dir)
+        model = load_model(data_dir)
+        # Features are resolved through the model's own table, so re-extracting
+        # feature_vocab.txt after training cannot remap its rules.
+        self.vocab = model.feature_vocab()
+        if self.vocab is None:
+            self.vocab = FeatureVocab.load(data_dir / FEATURE_VOCAB_FILE)
+        self.extract_fn = extract_fn
+        self.rules = {word: CompiledDecisionList(model.decision_list(word)) for word in model}
+        self.substitutions = {w: t for w, t in (substitutions or {}).items() if t in self.rules}
+
+        # Build the rank arrays now rather than on the first request.
+        for compiled in self.rules.values():
+            compiled._rank_by_feature(len(self.vocab))
+
+    def disambiguate(self, texts):
+        """
+        For every text, a list of {"word", "token", "sent_id", "tok_id",
+        "sense", "score"} per target occurrence: word is the model's target,
+        token the word in the text; sense and score are None when no rule
+        applies.
+        """
+        tokenized = [tokenize_text(clean_text(text)) for text in texts]
+        subs = self.substitutions
+        corpus = [[[subs.get(tok, tok) for tok in sentence] for sentence in sentences] for sentences in tokenized]
+
+        # target word -> its occurrences in this batch
+        occurrences = {}
+        for doc_id, sentences in enumerate(corpus):
+            for sent_id, sentence in enumerate(sentences):
+                for tok_id, tok in enumerate(sentence):
+                    if tok in self.rules:
+                        occurrences.setdefault(tok, []).append((doc_id, sent_id, tok_id))
+
+        results = [[] for _ in texts]
+        get = self.vocab.get
+        for word, occs in occurrences.items():
+            indptr = [0]
+            indices = []
+            for doc_id, sent_id, tok_id in occs:
+                # Features never seen in training cannot match a rule.
+                feature_ids = (get(f) for f in self.extract_fn(corpus, doc_id, sent_id, tok_id))
+                indices.extend(f for f in feature_ids if f is not None)
+                indptr.append(len(indices))
+            matrix = FeatureMatrix(
+                np.array(indptr, dtype=np.int64), np.array(indices, dtype=np.int32), None, None, None
+            )
+            senses, scores = self.rules[word].predict_scores(matrix)
+
+            for (doc_id, sent_id, tok_id), sense, score in zip(occs, senses.tolist(), scores.tolist()):
+                results[doc_id].append({
+                    "word": word,
+                    "token": tokenized[doc_id][sent_id][tok_id],
+                    "sent_id": sent_id,
+                    "tok_id": tok_id,
+                    "sense": sense or None,
+                    "score": None if sense == 0 else score,
+                })
+
+        for doc_results in results:
+            doc_results.sort(key=lambda r: (r["sent_id"], r["tok_id"]))
+        return results
+
+
+class MicroBatcher:
+    """
+    Collects concurrent requests into one batch call of fn(texts): a batch
+    is run once it holds max_batch texts or its first request has waited
+    max_wait seconds. submit() returns a Future with that request's results.
+    """
+
+    def __init__(self, fn, max_batch=MAX_BATCH, max_wait=MAX_WAIT_MS / 1000):
+        self.fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, texts):
+        future = Future()
+        self.requests.put((list(texts), future))
+        return future
+
+    def _next_batch(self):
+        batch = [self.requests.get()]
+        n_texts = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while n_texts < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(request)
+            n_texts += len(request[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            texts = [text for request_texts, _ in batch for text in request_texts]
+            try:
+                results = self.fn(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            start = 0
+            for request_texts, future in batch:
+                future.set_result(results[start:start + len(request_texts)])
+                start += len(request_texts)
+
+
+def make_handler(batcher):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._reply(200, {"status": "ok"})
+            else:
+                self._reply(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/disambiguate":
+                self._reply(404, {"error": "not found"})
+                return
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                texts = request["texts"]
+            except (ValueError, KeyError, TypeError):
+                texts = None
+            if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                self._reply(400, {"error": 'expected JSON {"texts": [...]} with a list of strings'})
+                return
+            try:
+                results = batcher.submit(texts).result()
+            except Exception as e:
+                self._reply(500, {"error": f"disambiguation failed: {e}"})
+                return
+            self._reply(200, {"results": results})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve_http(batcher, host, port):
+    server = ThreadingHTTPServer((host, port), make_handler(batcher))
+    print(f"Serving on http://{host}:{port}/disambiguate", file=sys.stderr)
+    server.serve_forever()
+
+
+def serve_stdin(batcher):
+    """One text per input line, one JSON list of occurrences per output line, in order."""
+    pending = queue.Queue()
+
+    def read():
+        for line in sys.stdin:
+            pending.put(batcher.submit([line]))
+        pending.put(None)
+
+    threading.Thread(target=read, daemon=True).start()
+    while (future := pending.get()) is not None:
+        sys.stdout.write(json.dumps(future.result()[0]) + "\n")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Disambiguate raw text with a trained decision list model.")
+    parser.add_argument("--model", choices=list(MODELS), default="synthetic")
+    parser.add_argument("--http", type=int, metavar="PORT", help="serve HTTP on PORT instead of stdin")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS)
+    args = parser.parse_args()
+
+    data_dir, extract_fn, substitutions = MODELS[args.model]
+    disambiguator = Disambiguator(data_dir, extract_fn, substitutions)
+    batcher = MicroBatcher(disambiguator.disambiguate, args.max_batch, args.max_wait_ms / 1000)
+
+    if args.http is not None:
+        serve_http(batcher, args.host, args.http)
+    else:
+        serve_stdin(batcher)
@@ -1,34 +1,159 @@
-from collections import Counter
-from collections import defaultdict
+import numpy as np
 
-def apply_ospd(word, predictions, feature_sets, 
-                                 confidence_threshold=0.55): 
-    doc_groups = defaultdict(list)
-    for inst_id, inst in enumerate(feature_sets[word]):
-        doc_groups[inst["doc_id"]].append(inst_id)
 
-    new_predictions = predictions.copy()
+class DocumentGroups:
+    """
+    Precomputed grouping of one word's instances by document: group[i] is
+    the document group of instance i. Build it once per word and reuse it
+    for every OSPD call on that word.
+    """
 
-    for doc_id, inst_ids in doc_groups.items():
-        sensed = [(i, predictions[i]) for i in inst_ids if predictions[i] is not None]
-        if not sensed:
-            continue
+    def __init__(self, doc_ids):
+        self.doc_ids, self.group = np.unique(np.asarray(doc_ids), return_inverse=True)
+        self.group = self.group.reshape(-1)
+        self.n_groups = len(self.doc_ids)
+        self.sizes = np.bincount(self.group, minlength=self.n_groups)
 
-        senses_only = [s for i, s in sensed]
-        count = Counter(senses_only)
-        majority_sense, majority_cnt = count.most_common(1)[0]
-        total_tagged = len(senses_only)
+    def __len__(self):
+        return self.n_groups
 
-        agreement_ratio = majority_cnt / total_tagged
+    def members(self):
+        """Instance ids of every document group, in instance order."""
+        order = np.argsort(self.group, kind="stable")
+        return [m.tolist() for m in np.split(order, np.cumsum(self.sizes)[:-1])]
 
-        if agreement_ratio >= confidence_threshold:
-            # Safe to enforce — high agreement
-            for i in inst_ids:
-                new_predictions[i] = majority_sense
+    def tally(self, predictions):
+        """
+        Per-document (majority, agreement, tagged) arrays for a prediction
+        vector (0 = untagged). A majority tie goes to the sense tagged first
+        in the document, as Counter.most_common does.
+        """
+        predictions = np.asarray(predictions)
+        n = len(predictions)
+        inst = np.flatnonzero(predictions)
+        senses, codes = np.unique(predictions[inst], return_inverse=True)
+        n_senses = max(len(senses), 1)
+
+        key = self.group[inst] * n_senses + codes.reshape(-1)
+        counts = np.bincount(key, minlength=self.n_groups * n_senses).reshape(self.n_groups, n_senses)
+        first = np.full(self.n_groups * n_senses, n, dtype=np.int64)
+        seen, first_at = np.unique(key, return_index=True)
+        first[seen] = inst[first_at]
+        first = first.reshape(self.n_groups, n_senses)
+
+        tagged = counts.sum(axis=1)
+        top = counts.max(axis=1)
+        winner = np.where(counts == top[:, None], first, n).argmin(axis=1)
+        majority = senses[winner] if len(senses) else np.zeros(self.n_groups, dtype=predictions.dtype)
+        agreement = top / np.maximum(tagged, 1)
+        return majority, agreement, tagged
+
+
+def prediction_array(predictions):
+    """Prediction list with None for untagged -> int vector with 0 for untagged."""
+    return np.array([0 if p is None else p for p in predictions], dtype=np.int64)
+
+
+def ospd_array(groups, predictions, confidence_threshold=0.55):
+    """
+    Vectorized OSPD over a prediction vector (0 = untagged). Documents whose
+    majority agreement reaches the threshold get the majority sense on every
+    instance; documents below it are rejected (all 0). Documents with no
+    tagged instance are left as they are.
+    """
+    predictions = np.asarray(predictions)
+    majority, agreement, tagged = groups.tally(predictions)
+    enforce = (tagged > 0) & (agreement >= confidence_threshold)
+    reject = (tagged > 0) & ~enforce
+
+    out = predictions.copy()
+    enforced = enforce[groups.group]
+    out[enforced] = majority[groups.group[enforced]]
+    out[reject[groups.group]] = 0
+    return out
+
+
+def apply_ospd(word, predictions, feature_sets,
+               confidence_threshold=0.55, groups=None):
+    if groups is None:
+        groups = DocumentGroups(feature_sets[word].doc_ids)
+    out = ospd_array(groups, prediction_array(predictions), confidence_threshold)
+    return [p if p else None for p in out.tolist()]
+
+
+def sweep_thresholds(groups, predictions, gold, thresholds):
+    """
+    OSPD outcome for many thresholds from one tally: returns (correct,
+    covered), the number of instances labeled correctly and labeled at all
+    after apply_ospd with each threshold. A document is enforced exactly
+    when its agreement >= threshold, so with documents sorted by agreement
+    each threshold is a prefix sum lookup.
+    """
+    predictions = np.asarray(predictions)
+    gold = np.asarray(gold)
+    majority, agreement, tagged = groups.tally(predictions)
+
+    docs = np.flatnonzero(tagged)
+    majority_correct = np.bincount(
+        groups.group, weights=gold == majority[groups.group], minlength=groups.n_groups
+    )
+    order = docs[np.argsort(-agreement[docs], kind="stable")]
+    cum_correct = np.concatenate([[0], np.cumsum(majority_correct[order])])
+    cum_covered = np.concatenate([[0], np.cumsum(groups.sizes[order])])
+
+    n_enforced = np.searchsorted(-agreement[order], -np.asarray(thresholds, dtype=np.float64), side="right")
+    return cum_correct[n_enforced].astype(np.int64), cum_covered[n_enforced]
+
+
+class DocumentTallies:
+    """
+    OSPD inside the bootstrapping loop: per-document sense counts of the
+    labeled instances of one word, updated only for the documents that
+    newly labeled instances fall in. When a document's majority agreement
+    reaches the threshold, its unlabeled instances are labeled with the
+    majority sense. Labels are only added, never revoked, so a document
+    below the threshold is re-checked only when its tally changes.
+    """
+
+    def __init__(self, groups, confidence_threshold=0.55):
+        self.group = groups.group.tolist()
+        self.members = groups.members()
+        self.threshold = confidence_threshold
+        self.counts = [{} for _ in range(len(groups))]     # sense -> [count, first inst_id]
+        self.tagged = [0] * len(groups)
+        self.unlabeled = groups.sizes.tolist()
+
+    def _count(self, inst_id, sense):
+        g = self.group[inst_id]
+        tally = self.counts[g].get(sense)
+        if tally is None:
+            self.counts[g][sense] = [1, inst_id]
         else:
-            # Substantial disagreement → reject ALL instances in this document
-            # (return to untagged/residual pool)
-            for i in inst_ids:
-                new_predictions[i] = None   # or "UNKNOWN", or remove from training
+            tally[0] += 1
+            tally[1] = min(tally[1], inst_id)
+        self.tagged[g] += 1
+        self.unlabeled[g] -= 1
+        return g
+
+    def extend(self, new_labels, labels):
+        """
+        Count new_labels (not yet in labels) and return them together with
+        the instances OSPD labels in the documents they touched.
+        """
+        touched = {self._count(inst_id, sense) for inst_id, sense in new_labels.items()}
+
+        added = {}
+        for g in sorted(touched):
+            if not self.unlabeled[g]:
+                continue
+            # Ties go to the sense of the document's first labeled instance,
+            # as in DocumentGroups.tally.
+            sense, (top, _) = max(self.counts[g].items(), key=lambda item: (item[1][0], -item[1][1]))
+            if top / self.tagged[g] >= self.threshold:
+                for inst_id in self.members[g]:
+                    if inst_id not in labels and inst_id not in new_labels:
+                        added[inst_id] = sense
 
-    return new_predictions
\ No newline at end of file
+        for inst_id, sense in added.items():
+            self._count(inst_id, sense)
+        return {**new_labels, **added}
@@ -1,7 +1,16 @@
 import pickle
+import argparse
+from functools import partial
 from pathlib import Path
-import math
-from collections import defaultdict
+
+from src.core.decision_list import add_pruning_arguments, prune_model, pruning_options
+from src.core.features import FEATURE_VOCAB_FILE, FeatureVocab, feature_counts, load_feature_sets
+from src.core.incremental import bootstrap
+from src.core.parallel import train_parallel
+from src.core.llr import rank_decision_list
+from src.core.model_store import MODEL_FILE, LABELS_FILE, save_model
+from src.core.seed_matcher import SeedMatcher
+from src.core.telemetry import telemetry, instrumented, add_arguments as add_telemetry_arguments
 
 DATA_DIR = Path("data/synthetic")
 
@@ -28,83 +37,78 @@ SEED_RULES = {
     }
 }
 
-def apply_seed_rules(word, feature_sets):
-    labels = {}
-    seeds = SEED_RULES[word]
-
-    for inst_id, inst in enumerate(feature_sets[word]):
-        feats = inst["features"]
-        for sense, cues in seeds.items():
-            if any(cue in f for f in feats for cue in cues):
-                labels[inst_id] = sense
-                break
-    return labels
-
+# "exact": a cue matches a feature value exactly (WINDOW=oil, not WINDOW=soil)
+# "substring": a cue matches any feature containing it
+SEED_MATCH = "exact"
 
-def compute_feature_stats(word, feature_sets, labels):
-    stats = defaultdict(lambda: {1: 0, 2: 0})
-
-    for inst_id, inst in enumerate(feature_sets[word]):
-        if inst_id not in labels:
-            continue
-        sense = labels[inst_id]
-        for feat in inst["features"]:
-            stats[feat][sense] += 1
+LLR_SMOOTHING = 0.1
+MAX_ITERATIONS = 10
 
-    return stats
+# OSPD agreement threshold used inside the bootstrapping loop, or None to
+# bootstrap from the decision list alone.
+BOOTSTRAP_OSPD = None
 
+# Train on each distinct context once, weighted by how many instances share
+# it. Same model and labels; not used with BOOTSTRAP_OSPD, which can label
+# copies in different documents differently.
+DEDUP_CONTEXTS = False
 
-def compute_llr(stats):
-    dl = []
-    for feat, counts in stats.items():
-        c1 = counts[1] + 0.1
-        c2 = counts[2] + 0.1
-        llr = abs(math.log(c1/c2))
-        sense = 1 if c1 > c2 else 2
-        dl.append((feat, sense, llr))
-    dl.sort(key=lambda x: x[2], reverse=True)
-    return dl
+def apply_seed_rules(word, feature_sets, mode=SEED_MATCH, seed_rules=None):
+    # seed_rules replaces SEED_RULES, e.g. with generated cues (src/utils/pseudowords.py)
+    matcher = SeedMatcher((seed_rules or SEED_RULES)[word], mode=mode)
+    return matcher.label(feature_sets[word])
 
 
-def bootstrap(word, feature_sets, labels, dl):
-    added = 0
+def compute_feature_stats(word, feature_sets, labels):
+    # (feature_ids, counts[:, sense - 1]) as a sparse matrix x label product
+    return feature_counts(feature_sets[word], labels)
 
-    for inst_id, inst in enumerate(feature_sets[word]):
-        if inst_id in labels:
-            continue
-        feats = set(inst["features"])
-        for feat, sense, score in dl:
-            if feat in feats:
-                labels[inst_id] = sense
-                added += 1
-                break
 
-    return added
+def compute_llr(stats, top_k=None):
+    feature_ids, counts = stats
+    return rank_decision_list(feature_ids, counts, smoothing=LLR_SMOOTHING, top_k=top_k)
 
 
-def train_single_word(word, feature_sets):
+def train_single_word(word, feature_sets, ospd_threshold=BOOTSTRAP_OSPD, seed_rules=None,
+                      smoothing=LLR_SMOOTHING, max_iterations=MAX_ITERATIONS, dedup=DEDUP_CONTEXTS):
+    # seed_rules replaces SEED_RULES, e.g. with generated cues (src/utils/pseudowords.py)
     print(f"\nTraining {word}")
-
-    labels = apply_seed_rules(word, feature_sets)
-
-    for it in range(10):
-        stats = compute_feature_stats(word, feature_sets, labels)
-        dl = compute_llr(stats)
-        new = bootstrap(word, feature_sets, labels, dl)
-        print(f"  iter {it}: {len(labels)} labeled (+{new})")
-        if new == 0:
-            break
-
+    labels, dl = bootstrap(
+        word, feature_sets[word], (seed_rules or SEED_RULES)[word], SEED_MATCH, smoothing=smoothing,
+        ospd_threshold=ospd_threshold, dedup=dedup, max_iterations=max_iterations,
+    )
     return {"labels": labels, "decision_list": dl}
 
 
 if __name__ == "__main__":
-    feature_sets = pickle.load(open(DATA_DIR/"feature_sets.pkl", "rb"))
-    targets = pickle.load(open(DATA_DIR/"targets.pkl", "rb"))
-
-    model = {}
-    for w in targets:
-        model[w] = train_single_word(w, feature_sets)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=1,
+                        help="> 1 trains target words in parallel on a process pool")
+    parser.add_argument("--ospd", type=float, default=BOOTSTRAP_OSPD, metavar="THRESHOLD",
+                        help="apply one-sense-per-discourse inside the bootstrapping loop")
+    parser.add_argument("--dedup", action="store_true", default=DEDUP_CONTEXTS,
+                        help="train on distinct contexts weighted by their count (ignored with --ospd)")
+    add_pruning_arguments(parser)
+    add_telemetry_arguments(parser)
+    args = parser.parse_args()
+    prune = pruning_options(args)
 
-    pickle.dump(model, open(DATA_DIR/"decision_lists.pkl", "wb"))
-    print("\nSaved decision_lists.pkl")
\ No newline at end of file
+    targets = pickle.load(open(DATA_DIR/"targets.pkl", "rb"))
+    train_fn = partial(train_single_word, ospd_threshold=args.ospd, dedup=args.dedup)
+
+    with instrumented(args.metrics, args.profile):
+        if args.workers > 1:
+            model = train_parallel(train_fn, DATA_DIR, targets, workers=args.workers)
+        else:
+            with telemetry.timer("load"):
+                feature_sets, feature_vocab = load_feature_sets(DATA_DIR)
+            model = {}
+            for w in targets:
+                model[w] = train_fn(w, feature_sets)
+
+        if prune:
+            with telemetry.timer("prune"):
+                model = prune_model(model, load_feature_sets(DATA_DIR)[0], **prune)
+
+        save_model(model, FeatureVocab.load(DATA_DIR/FEATURE_VOCAB_FILE), DATA_DIR)
+        print(f"\nSaved {MODEL_FILE} and {LABELS_FILE}")
@@ -1,9 +1,14 @@
+import heapq
 import pickle
+import argparse
 from pathlib import Path
-from collections import defaultdict
-from copy import deepcopy
+
+import numpy as np
 
 from src.preprocess import load_preprocessed_data
+from src.corpus_store import CorpusOverlay, read_doc_watermark, write_doc_watermark
+from src.core.extract import extract_feature_matrices
+from src.core.features import FeatureVocab, concat_feature_matrices, load_feature_sets, save_feature_sets
 
 # ==================================================================
 # Synthetic ambiguous words
@@ -19,6 +24,11 @@ SYNTHETIC_PAIRS = {
 DATA_DIR = "data/preprocessed"
 OUT_DIR = Path("data/synthetic")
 OUT_DIR.mkdir(parents=True, exist_ok=True)
+WATERMARK_FILE = "feature_sets_docs.json"
+# Collect occurrences from canonical documents only (needs preprocess --near-dups).
+SKIP_NEAR_DUPS = False
+
+WINDOW = 4
 
 STOPWORDS = {
     "the","a","an","in","of","and","to","on","for","by","with","was","is",
@@ -27,30 +37,24 @@ STOPWORDS = {
 }
 
 # ==================================================================
-# Feature extractor (clean & optimized)
+# Feature extractor
 # ==================================================================
-def extract_features(corpus, doc_id, sent_id, tok_id, window=4):
+COLLOCATIONS = (("LEFT1", -1), ("LEFT2", -2), ("RIGHT1", 1), ("RIGHT2", 2))
+
+
+def extract_features(corpus, doc_id, sent_id, tok_id, window=WINDOW):
+    """
+    Features of one occurrence (src/serve.py labels raw text with it);
+    build_synthetic_features extracts the same features for all
+    occurrences at once.
+    """
     sent = corpus[doc_id][sent_id]
     feats = []
 
-    def get_word(idx):
-        if 0 <= idx < len(sent):
-            w = sent[idx]
-            if w not in STOPWORDS:
-                return w
-        return None
-
-    offsets = {
-        "LEFT1":  tok_id - 1,
-        "LEFT2":  tok_id - 2,
-        "RIGHT1": tok_id + 1,
-        "RIGHT2": tok_id + 2,
-    }
-
-    for label, pos in offsets.items():
-        w = get_word(pos)
-        if w:
-            feats.append(f"{label}={w}")
+    for label, offset in COLLOCATIONS:
+        pos = tok_id + offset
+        if 0 <= pos < len(sent) and sent[pos] not in STOPWORDS:
+            feats.append(f"{label}={sent[pos]}")
 
     # WINDOW
     target = sent[tok_id]
@@ -64,49 +68,106 @@ def extract_features(corpus, doc_id, sent_id, tok_id, window=4):
     return feats
 
 
+def extract_synthetic_features(overlay, positions, feature_vocab, window=WINDOW, distances=False):
+    """extract_feature_matrices with the synthetic pipeline's features (see extract_features)."""
+    return extract_feature_matrices(
+        overlay, positions, feature_vocab, COLLOCATIONS, window,
+        stopwords=STOPWORDS, skip_target=True, distances=distances,
+    )
+
+
+def find_occurrences(token_index, pairs, min_doc=0):
+    """
+    Occurrences of every pseudoword's source words, found by merging their
+    postings lists only: {synth: [(doc_id, sent_id, tok_id, sense_id), ...]}
+    in corpus order. Cost is proportional to the words' frequencies.
+    With min_doc, only documents from min_doc on are read.
+    """
+    def lookup(w):
+        return token_index.occurrences(w, min_doc) if min_doc else token_index.get(w, [])
+
+    occurrences = {}
+    for synth, words in pairs.items():
+        postings = [
+            [(doc_id, sent_id, tok_id, sense_id) for doc_id, sent_id, tok_id in lookup(w)]
+            for sense_id, w in enumerate(words, start=1)
+        ]
+        occurrences[synth] = list(heapq.merge(*postings))
+    return occurrences
+
+
+def build_synthetic_features(overlay, occurrences, feature_vocab):
+    """
+    Substitute every occurrence's pseudoword into the overlay, then extract
+    features once every substitution is in place, so both left and right
+    contexts see the conflated words.
+
+    Returns ({synth: FeatureMatrix}, {synth: [sense_id, ...]}) for the
+    pseudowords that occur.
+    """
+    for synth_word, occs in occurrences.items():
+        for doc_id, sent_id, tok_id, sense_id in occs:
+            overlay.substitute(doc_id, sent_id, tok_id, synth_word)
+
+    positions = {
+        synth_word: tuple(np.array([o[i] for o in occs], dtype=np.int64) for i in range(3))
+        for synth_word, occs in occurrences.items() if occs
+    }
+    feature_sets = extract_synthetic_features(overlay, positions, feature_vocab)
+    gold_labels = {synth_word: [sense_id for *_, sense_id in occurrences[synth_word]] for synth_word in positions}
+    return feature_sets, gold_labels
+
+
 # ==================================================================
 # Build synthetic corpus + feature sets
 # ==================================================================
 if __name__ == "__main__":
-    corpus, token_index = load_preprocessed_data(DATA_DIR)
-    synthetic_corpus = deepcopy(corpus)
-
-    feature_sets = defaultdict(list)
-    gold_labels = defaultdict(list)
-    orig_map = {}
-
-    for synth, (w1, w2) in SYNTHETIC_PAIRS.items():
-        orig_map[w1] = (synth, 1)
-        orig_map[w2] = (synth, 2)
-
-    for doc_id, doc in enumerate(corpus):
-        for sent_id, sent in enumerate(doc):
-            for tok_id, tok in enumerate(sent):
-                if tok in orig_map:
-                    synth_word, sense_id = orig_map[tok]
-
-                    synthetic_corpus[doc_id][sent_id][tok_id] = synth_word
-
-                    feats = extract_features(synthetic_corpus, doc_id, sent_id, tok_id)
-
-                    feature_sets[synth_word].append({
-                        "doc_id": doc_id,
-                        "sent_id": sent_id,
-                        "tok_id": tok_id,
-                        "features": feats,
-                    })
-                    gold_labels[synth_word].append(sense_id)
-
-    targets = list(feature_sets.keys())
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--new-only", action="store_true",
+                        help="add occurrences from documents appended since the last run")
+    parser.add_argument("--skip-near-dups", action="store_true", default=SKIP_NEAR_DUPS,
+                        help="skip near-duplicate documents (doc_canonical.npy from preprocess --near-dups)")
+    args = parser.parse_args()
+
+    corpus, token_index = load_preprocessed_data(DATA_DIR, skip_near_dups=args.skip_near_dups)
+
+    min_doc = read_doc_watermark(OUT_DIR / WATERMARK_FILE) if args.new_only else None
+    if min_doc is None:
+        min_doc = 0
+        substitutions = {}
+        feature_vocab = FeatureVocab()
+        feature_sets = {}
+        gold_labels = {}
+    else:
+        print(f"Adding occurrences from doc_id {min_doc} on")
+        substitutions = pickle.load(open(OUT_DIR/"synthetic_overlay.pkl", "rb"))
+        # Loaded into memory, not mapped: the same files are rewritten below.
+        feature_sets, feature_vocab = load_feature_sets(OUT_DIR, mmap_mode=None)
+        gold_labels = pickle.load(open(OUT_DIR/"gold_labels.pkl", "rb"))
+
+    # Only the substituted positions are stored; the base corpus is read
+    # through the overlay instead of being deep-copied.
+    synthetic_corpus = CorpusOverlay(corpus, substitutions)
+
+    occurrences = find_occurrences(token_index, SYNTHETIC_PAIRS, min_doc=min_doc)
+    new_sets, new_gold = build_synthetic_features(synthetic_corpus, occurrences, feature_vocab)
+    for synth_word, matrix in new_sets.items():
+        if synth_word in feature_sets:
+            matrix = concat_feature_matrices(feature_sets[synth_word], matrix)
+        feature_sets[synth_word] = matrix
+        gold_labels.setdefault(synth_word, []).extend(new_gold[synth_word])
+
+    targets = [t for t in SYNTHETIC_PAIRS if t in feature_sets]
 
     print("\nSynthetic words and instance counts:")
     for t in targets:
         print(f"{t}: {len(feature_sets[t])}")
 
     # Save output
-    pickle.dump(synthetic_corpus, open(OUT_DIR/"synthetic_corpus.pkl", "wb"))
-    pickle.dump(dict(feature_sets), open(OUT_DIR/"feature_sets.pkl", "wb"))
-    pickle.dump(dict(gold_labels), open(OUT_DIR/"gold_labels.pkl", "wb"))
+    pickle.dump(synthetic_corpus.substitutions, open(OUT_DIR/"synthetic_overlay.pkl", "wb"))
+    save_feature_sets(feature_sets, feature_vocab, OUT_DIR)
+    pickle.dump(gold_labels, open(OUT_DIR/"gold_labels.pkl", "wb"))
     pickle.dump(targets, open(OUT_DIR/"targets.pkl", "wb"))
+    write_doc_watermark(OUT_DIR / WATERMARK_FILE, len(corpus))
 
-    print("\nSaved synthetic corpus + features.")
\ No newline at end of file
+    print("\nSaved synthetic corpus overlay + features.")
@@ -2,26 +2,32 @@ import pickle
 from collections import Counter
 from pathlib import Path
 
+from src.core.features import load_feature_sets
+
 DATA_DIR = Path("data/synthetic")
 
-feature_sets = pickle.load(open(DATA_DIR / "feature_sets.pkl", "rb"))
-gold_labels = pickle.load(open(DATA_DIR / "gold_labels.pkl", "rb"))
-targets = pickle.load(open(DATA_DIR / "targets.pkl", "rb"))
 
-def top_features(word, sense, n=50):
+def top_features(matrix, labels, sense, n=50):
+    """Most frequent features of the instances labeled `sense`, as (feature string, count)."""
     counts = Counter()
-    for inst, label in zip(feature_sets[word], gold_labels[word]):
+    for feats, label in zip(matrix.rows(), labels):
         if label == sense:
-            counts.update(inst["features"])
-    return counts.most_common(n)
-
-for word in targets:
-    print(f"\n=== {word.upper()} ===")
-    
-    print("\nTop features for SENSE 1:")
-    for f, c in top_features(word, 1):
-        print(f"{f:30} {c}")
-
-    print("\nTop features for SENSE 2:")
-    for f, c in top_features(word, 2):
-        print(f"{f:30} {c}")
\ No newline at end of file
+            counts.update(feats)
+    return [(matrix.vocab[f], c) for f, c in counts.most_common(n)]
+
+
+if __name__ == "__main__":
+    feature_sets, feature_vocab = load_feature_sets(DATA_DIR)
+    gold_labels = pickle.load(open(DATA_DIR / "gold_labels.pkl", "rb"))
+    targets = pickle.load(open(DATA_DIR / "targets.pkl", "rb"))
+
+    for word in targets:
+        print(f"\n=== {word.upper()} ===")
+
+        print("\nTop features for SENSE 1:")
+        for f, c in top_features(feature_sets[word], gold_labels[word], 1):
+            print(f"{f:30} {c}")
+
+        print("\nTop features for SENSE 2:")
+        for f, c in top_features(feature_sets[word], gold_labels[word], 2):
+            print(f"{f:30} {c}")
@@ -0,0 +1,213 @@
+import json
+import pickle
+import random
+import argparse
+from bisect import bisect_left, bisect_right
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+
+from src.preprocess import load_preprocessed_data
+from src.corpus_store import CorpusOverlay
+from src.synthetic_wsd import STOPWORDS, find_occurrences, build_synthetic_features
+from src.synthetic_train import train_single_word
+from src.synthetic_ospd import apply_ospd
+from src.evaluation.synthetic_eval import OSPD_THRESHOLD
+from src.utils.inspect_synthetic import top_features
+from src.core.decision_list import CompiledDecisionList
+from src.core.features import FeatureVocab, save_feature_sets
+from src.core.model_store import save_model
+from src.core.parallel import train_parallel
+from src.core.telemetry import telemetry, instrumented, add_arguments as add_telemetry_arguments
+
+DATA_DIR = "data/preprocessed"
+OUT_DIR = Path("data/pseudowords")
+
+N_PAIRS = 100
+# Frequency band of the source words. There is no POS tagger in the
+# pipeline, so mid-frequency alphabetic non-stopwords stand in for nouns.
+MIN_COUNT = 50
+MAX_COUNT = 5000
+MIN_WORD_LEN = 3
+MAX_FREQ_RATIO = 1.5     # the more frequent word of a pair occurs at most this many times as often
+
+# Documents with doc_id % HOLDOUT_EVERY == 0 are held out: seed cues are
+# derived from their gold senses, training and evaluation use the rest.
+HOLDOUT_EVERY = 10
+N_CUES = 5               # seed cues per sense
+MIN_CUE_COUNT = 3        # held-out instances a cue must occur with
+MIN_CUE_PURITY = 0.8     # share of those instances with the cue's sense
+
+
+def candidate_words(token_index, vocab, min_count=MIN_COUNT, max_count=MAX_COUNT):
+    """{word: corpus frequency} of the words that may be conflated."""
+    counts = token_index.counts()
+    ids = np.flatnonzero((counts >= min_count) & (counts <= max_count))
+    return {
+        vocab[i]: int(counts[i]) for i in ids.tolist()
+        if vocab[i].isalpha() and len(vocab[i]) >= MIN_WORD_LEN and vocab[i] not in STOPWORDS
+    }
+
+
+def sample_pairs(candidates, n_pairs, seed=0, max_ratio=MAX_FREQ_RATIO, vocab=()):
+    """
+    Up to n_pairs random pairs of distinct candidate words whose frequencies
+    are within max_ratio of each other, as {pseudoword: (word1, word2)}
+    like SYNTHETIC_PAIRS. Each word is used once, and pseudowords that are
+    already real words are skipped. The same seed gives the same pairs.
+    """
+    rng = random.Random(seed)
+    words = sorted(candidates, key=lambda w: (candidates[w], w))
+    freqs = [candidates[w] for w in words]
+    existing = set(vocab)
+
+    order = list(range(len(words)))
+    rng.shuffle(order)
+    used = set()
+    pairs = {}
+    for i in order:
+        if len(pairs) == n_pairs:
+            break
+        if words[i] in used:
+            continue
+        lo = bisect_left(freqs, freqs[i] / max_ratio)
+        hi = bisect_right(freqs, freqs[i] * max_ratio)
+        partners = [words[j] for j in range(lo, hi) if j != i and words[j] not in used]
+        if not partners:
+            continue
+        pair = (words[i], rng.choice(partners))
+        name = "".join(pair)
+        if name in existing or name in pairs:
+            continue
+        pairs[name] = pair
+        used.update(pair)
+    return pairs
+
+
+def split_heldout(occurrences, every=HOLDOUT_EVERY):
+    """Split {synth: [(doc_id, sent_id, tok_id, sense_id), ...]} into (held-out, rest) by document."""
+    heldout = {w: [o for o in occs if o[0] % every == 0] for w, occs in occurrences.items()}
+    rest = {w: [o for o in occs if o[0] % every != 0] for w, occs in occurrences.items()}
+    return heldout, rest
+
+
+def derive_seed_rules(feature_sets, gold_labels, n_cues=N_CUES,
+                      min_count=MIN_CUE_COUNT, min_purity=MIN_CUE_PURITY):
+    """
+    SEED_RULES-style {synth: {1: [cue, ...], 2: [cue, ...]}} from the
+    held-out instances: the most frequent WINDOW collocates of each sense
+    that occur with that sense in at least min_purity of their instances.
+    Pseudowords that get no cue for one of their senses are left out.
+    """
+    seed_rules = {}
+    for word, matrix in feature_sets.items():
+        window = {}
+        for sense in (1, 2):
+            window[sense] = {
+                f.split("=", 1)[1]: c
+                for f, c in top_features(matrix, gold_labels[word], sense, n=None)
+                if f.startswith("WINDOW=")
+            }
+
+        rules = {}
+        for sense, other in ((1, 2), (2, 1)):
+            rules[sense] = [
+                cue for cue, c in window[sense].items()
+                if c >= min_count and c / (c + window[other].get(cue, 0)) >= min_purity
+            ][:n_cues]
+        if rules[1] and rules[2]:
+            seed_rules[word] = rules
+    return seed_rules
+
+
+def evaluate(model, feature_sets, gold_labels, ospd_threshold=OSPD_THRESHOLD):
+    """{word: {"correct", "covered", "total"}} of the OSPD-filtered predictions, as synthetic_eval reports them."""
+    results = {}
+    for word, trained in model.items():
+        raw = CompiledDecisionList(trained["decision_list"]).predict_all(feature_sets[word])
+        predictions = apply_ospd(word, raw, feature_sets, confidence_threshold=ospd_threshold)
+        gold = gold_labels[word]
+        results[word] = {
+            "correct": sum(1 for p, g in zip(predictions, gold) if p == g),
+            "covered": sum(1 for p in predictions if p is not None),
+            "total": len(gold),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate frequency-matched pseudoword pairs and build, train and evaluate them in one batch.")
+    parser.add_argument("--n-pairs", type=int, default=N_PAIRS)
+    parser.add_argument("--min-count", type=int, default=MIN_COUNT)
+    parser.add_argument("--max-count", type=int, default=MAX_COUNT)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="> 1 trains pseudowords in parallel on a process pool")
+    parser.add_argument("--skip-near-dups", action="store_true",
+                        help="skip near-duplicate documents (doc_canonical.npy from preprocess --near-dups)")
+    add_telemetry_arguments(parser)
+    args = parser.parse_args()
+
+    with instrumented(args.metrics, args.profile):
+        with telemetry.timer("load"):
+            corpus, token_index = load_preprocessed_data(DATA_DIR, skip_near_dups=args.skip_near_dups)
+
+        with telemetry.timer("sample_pairs"):
+            candidates = candidate_words(token_index, corpus.vocab, args.min_count, args.max_count)
+            pairs = sample_pairs(candidates, args.n_pairs, args.seed, vocab=corpus.vocab)
+        print(f"{len(candidates)} candidate words, {len(pairs)} pairs")
+
+        # Held-out and training documents are disjoint, so their features
+        # can be built separately on the same overlay.
+        with telemetry.timer("build"):
+            overlay = CorpusOverlay(corpus)
+            feature_vocab = FeatureVocab()
+            heldout, rest = split_heldout(find_occurrences(token_index, pairs))
+            heldout_sets, heldout_gold = build_synthetic_features(overlay, heldout, feature_vocab)
+            feature_sets, gold_labels = build_synthetic_features(overlay, rest, feature_vocab)
+
+        with telemetry.timer("derive_cues"):
+            seed_rules = derive_seed_rules(heldout_sets, heldout_gold)
+        targets = [w for w in pairs if w in seed_rules and w in feature_sets]
+        print(f"{len(targets)} pseudowords with seed cues for both senses")
+
+        OUT_DIR.mkdir(parents=True, exist_ok=True)
+        save_feature_sets({w: feature_sets[w] for w in targets}, feature_vocab, OUT_DIR)
+        pickle.dump({w: gold_labels[w] for w in targets}, open(OUT_DIR/"gold_labels.pkl", "wb"))
+        pickle.dump(targets, open(OUT_DIR/"targets.pkl", "wb"))
+        with open(OUT_DIR/"pairs.json", "w") as f:
+            json.dump({w: {"words": pairs[w], "seed_rules": seed_rules[w]} for w in targets}, f, indent=2)
+
+        with telemetry.timer("train"):
+            train_fn = partial(train_single_word, seed_rules=seed_rules)
+            if args.workers > 1:
+                model = train_parallel(train_fn, OUT_DIR, targets, workers=args.workers)
+            else:
+                model = {w: train_fn(w, feature_sets) for w in targets}
+        save_model(model, feature_vocab, OUT_DIR)
+
+        with telemetry.timer("evaluate"):
+            results = evaluate(model, feature_sets, gold_labels)
+
+        print("\nPseudoword Evaluation Results")
+        for word, r in results.items():
+            print(f"{word}: {r['correct']}/{r['total']} = {r['correct'] / r['total'] * 100:.2f}% "
+                  f"(coverage {r['covered'] / r['total'] * 100:.2f}%)")
+        correct = sum(r["correct"] for r in results.values())
+        covered = sum(r["covered"] for r in results.values())
+        total = sum(r["total"] for r in results.values())
+        if total:
+            print(f"\nOverall: {correct}/{total} = {correct / total * 100:.2f}% "
+                  f"(coverage {covered / total * 100:.2f}%)")
+
+        with open(OUT_DIR/"results.json", "w") as f:
+            json.dump({
+                "n_pairs": len(targets),
+                "seed": args.seed,
+                "accuracy": correct / total if total else None,
+                "coverage": covered / total if total else None,
+                "words": results,
+            }, f, indent=2)
+        print(f"Saved {OUT_DIR}/results.json")
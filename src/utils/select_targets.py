@@ -2,13 +2,18 @@
 
 from pathlib import Path
 import pickle
-from preprocess import load_preprocessed_data 
+import argparse
+from src.preprocess import load_preprocessed_data
+from src.corpus_store import read_doc_watermark, write_doc_watermark
 
 
 DATA_DIR = "data/preprocessed"
+WATERMARK_FILE = "instances_docs.json"
+# Collect instances from canonical documents only (needs preprocess --near-dups).
+SKIP_NEAR_DUPS = False
 
-def load_data():
-    corpus, token_index = load_preprocessed_data(DATA_DIR)
+def load_data(skip_near_dups=SKIP_NEAR_DUPS):
+    corpus, token_index = load_preprocessed_data(DATA_DIR, skip_near_dups=skip_near_dups)
     return corpus, token_index
 
 
@@ -36,11 +41,19 @@ def print_sample_contexts(corpus, token_index, word, k=10, window=4):
         print(f"{i+1:2d}: {' '.join(left)} [{token}] {' '.join(right)}")
 
 
-def build_instances_for_targets(corpus, token_index, targets, max_instances=None):
+def build_instances_for_targets(token_index, targets, max_instances=None, min_doc=0):
+    """
+    Instances come straight from the postings lists; the corpus itself is
+    not scanned or copied (features are extracted later from doc/sent/tok).
+    With min_doc, only documents from min_doc on are read.
+    """
     instances = {}
 
     for word in targets:
-        positions = token_index.get(word, [])
+        if min_doc:
+            positions = token_index.occurrences(word, min_doc)
+        else:
+            positions = token_index.get(word, [])
         if max_instances is not None:
             positions = positions[:max_instances]
 
@@ -50,7 +63,6 @@ def build_instances_for_targets(corpus, token_index, targets, max_instances=None
                 "doc_id": doc_id,
                 "sent_id": sent_id,
                 "tok_id": tok_id,
-                "sentence": corpus[doc_id][sent_id],
             })
 
         instances[word] = word_instances
@@ -59,7 +71,14 @@ def build_instances_for_targets(corpus, token_index, targets, max_instances=None
     return instances
 
 if __name__ == "__main__":
-    corpus, token_index = load_data()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--new-only", action="store_true",
+                        help="add instances from documents appended since the last run")
+    parser.add_argument("--skip-near-dups", action="store_true", default=SKIP_NEAR_DUPS,
+                        help="skip near-duplicate documents (doc_canonical.npy from preprocess --near-dups)")
+    args = parser.parse_args()
+
+    corpus, token_index = load_data(args.skip_near_dups)
 
     # Candidate ambiguous nouns
     CANDIDATES = [
@@ -76,12 +95,22 @@ if __name__ == "__main__":
         print_sample_contexts(corpus, token_index, w, k=12)
 
     
-    instances = build_instances_for_targets(corpus, token_index, TARGETS)
-
     out = Path(DATA_DIR)
+    min_doc = read_doc_watermark(out / WATERMARK_FILE) if args.new_only else None
+    if min_doc is None:
+        instances = build_instances_for_targets(token_index, TARGETS)
+    else:
+        print(f"\nAdding instances from doc_id {min_doc} on")
+        with open(out / "instances.pkl", "rb") as f:
+            instances = pickle.load(f)
+        new_instances = build_instances_for_targets(token_index, TARGETS, min_doc=min_doc)
+        for w in TARGETS:
+            instances.setdefault(w, []).extend(new_instances[w])
+
     with open(out / "targets.pkl", "wb") as f:
         pickle.dump(TARGETS, f)
     with open(out / "instances.pkl", "wb") as f:
         pickle.dump(instances, f)
+    write_doc_watermark(out / WATERMARK_FILE, len(corpus))
 
     print("\nSaved targets.pkl and instances.pkl")
\ No newline at end of file